@@ -1,17 +1,30 @@
 from flask import Flask
 from flask_login import LoginManager
-from flask_mail import Mail
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 
 from config import config
+from .cache import PageCache
+from .counters import ViewCounter
+from .database import Database
+from .invalidation import InvalidationBus
 from .jinja_utils import jinja_init
+from .memprofile import MemoryProfiler
+from .ratelimit import RateLimiter
+from .shedding import LoadShedder
+from .traffic import TrafficRecorder
 
-db = SQLAlchemy()
+db = Database()
 login = LoginManager()
 login.login_view = "auth.login"
 moment = Moment()
-mail = Mail()
+page_cache = PageCache()
+fragment_cache = PageCache(4096, 3600, config_prefix="FRAGMENT_CACHE")
+limiter = RateLimiter()
+bus = InvalidationBus()
+view_counter = ViewCounter()
+load_shedder = LoadShedder()
+memory_profiler = MemoryProfiler()
+traffic_recorder = TrafficRecorder()
 
 
 def create_app(config_name):
@@ -20,10 +33,16 @@ def create_app(config_name):
     config[config_name].init_app(app)
 
     jinja_init(app)
-    mail.init_app(app)
     moment.init_app(app)
     db.init_app(app)
     login.init_app(app)
+    page_cache.init_app(app)
+    fragment_cache.init_app(app)
+    limiter.init_app(app)
+    bus.init_app(app)
+    load_shedder.init_app(app)
+    memory_profiler.init_app(app)
+    traffic_recorder.init_app(app)
     if app.config["SSL_REDIRECT"]:
         from flask_sslify import SSLify
         sslify = SSLify(app)
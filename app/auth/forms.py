@@ -2,7 +2,7 @@ import wtforms.validators as validators
 from flask_wtf import FlaskForm
 from wtforms import BooleanField, PasswordField, StringField, SubmitField
 
-from ..models import User
+from ..queries import user_by_email, user_by_username
 
 
 class LoginForm(FlaskForm):
@@ -35,11 +35,11 @@ class RegistrationForm(FlaskForm):
     submit = SubmitField("Register")
 
     def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
+        user = user_by_username(username.data)
         if user is not None:
             raise validators.ValidationError("Username already in use.")
 
     def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
+        user = user_by_email(email.data)
         if user is not None:
             raise validators.ValidationError("Email address already in use.")
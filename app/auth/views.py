@@ -3,20 +3,24 @@ from flask_login import current_user, login_required, login_user, logout_user
 from werkzeug.urls import url_parse
 
 from .. import db
+from ..decorators import rate_limit
 from ..email import send_email
 from ..models import User
+from ..queries import user_by_username
 from . import auth
 from .forms import LoginForm, RegistrationForm
 
 
 @auth.route("/login", methods=["GET", "POST"])
+@rate_limit("RATELIMIT_LOGIN")
+@rate_limit("RATELIMIT_LOGIN_USERNAME", field="username")
 def login():
     if current_user.is_authenticated:
         return redirect(url_for("main.index"))
 
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data).first()
+        user = user_by_username(form.username.data)
         if user is None or not user.verify_password(form.password.data):
             flash("Invalid username or password")
             return redirect(url_for("auth.login"))
@@ -36,6 +40,7 @@ def logout():
 
 
 @auth.route("/register", methods=["GET", "POST"])
+@rate_limit("RATELIMIT_REGISTER")
 def register():
     if current_user.is_authenticated:
         return redirect(url_for("main.index"))
@@ -0,0 +1,234 @@
+import fcntl
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request, session
+from flask_login import current_user
+
+from .metrics import metrics
+
+
+class PageCache():
+    """Small thread-safe LRU cache for rendered pages, shared by a worker's threads.
+
+    Expired entries are kept for another stale_timeout seconds so that
+    get_or_compute() can serve them while one caller refreshes them. With a
+    shared directory, rendered strings are also kept there for the other
+    workers on the machine until unused for sweep_age seconds.
+    """
+
+    def __init__(self, max_entries=256, timeout=60, config_prefix="PAGE_CACHE"):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.stale_timeout = 0
+        self.wait_timeout = 10
+        self.sweep_age = 3600
+        self.directory = None
+        self.config_prefix = config_prefix
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0
+
+    def init_app(self, app):
+        config = app.config.get_namespace(f"{self.config_prefix}_")
+        self.max_entries = config.get("size", self.max_entries)
+        self.timeout = config.get("timeout", self.timeout)
+        self.stale_timeout = config.get("stale_timeout", self.stale_timeout)
+        self.wait_timeout = config.get("wait_timeout", self.wait_timeout)
+        self.sweep_age = config.get("sweep_age", self.sweep_age)
+        self.directory = config.get("directory", self.directory)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        # Only this worker's entries; the shared ones belong to every worker.
+        with self._lock:
+            self._entries.clear()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            now = time.monotonic()
+            if expires < now:
+                if expires + self.stale_timeout < now:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def get_or_compute(self, key, compute):
+        """Return the value for *key*, calling *compute* for it at most once at a time.
+
+        Concurrent callers that miss wait for the first one's result instead of
+        computing it again; callers that find a stale entry get it straight
+        away while the first of them refreshes it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is not None and entry[0] >= now:
+                self._entries.move_to_end(key)
+                self._count("hits")
+                return entry[1]
+            flight = self._flights.get(key)
+            if flight is not None and entry is not None and entry[0] + self.stale_timeout >= now:
+                self._count("stale_hits")
+                return entry[1]
+            if flight is None:
+                self._flights[key] = threading.Event()
+        if flight is not None:
+            flight.wait(self.wait_timeout)
+            value = self.get(key)
+            if value is not None:
+                self._count("coalesced")
+                return value
+            # The first caller failed or is too slow; render it here instead.
+            return self._compute(key, compute)
+        try:
+            return self._compute(key, compute)
+        finally:
+            with self._lock:
+                self._flights.pop(key).set()
+
+    def _compute(self, key, compute):
+        self._count("misses")
+        value = self._compute_shared(key, compute) if self.directory else self._render(compute)
+        self.set(key, value)
+        return value
+
+    def _render(self, compute):
+        start = time.perf_counter()
+        value = compute()
+        metrics.observe(f"{self.config_prefix.lower()}.render", time.perf_counter() - start)
+        return value
+
+    def _count(self, name):
+        metrics.incr(f"{self.config_prefix.lower()}.{name}")
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode("utf-8")).hexdigest())
+
+    def _compute_shared(self, key, compute):
+        # One worker renders while the others wait for the lock, then read its
+        # copy; a worker that waits longer than wait_timeout renders it itself.
+        # Lock files are only removed by sweep(), as removing one that is held
+        # would let the next worker lock a new file and render alongside.
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_age
+            self.sweep()
+        path = self._path(key)
+        with open(path + ".lock", "a") as lock:
+            if not self._lock_file(lock):
+                self._count("lock_timeouts")
+                return self._render(compute)
+            os.utime(path + ".lock")
+            try:
+                if time.time() - os.path.getmtime(path) < self.timeout:
+                    with open(path, encoding="utf-8") as f:
+                        self._count("shared_hits")
+                        return f.read()
+            except FileNotFoundError:
+                pass
+            value = self._render(compute)
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}"
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(value)
+            os.replace(temporary, path)
+            return value
+
+    def sweep(self):
+        """Remove shared entries, and their lock files, unused for sweep_age seconds."""
+        cutoff = time.time() - self.sweep_age
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".lock"):
+                # Left behind by a worker that died while writing.
+                if name.count(".") == 2 and self._mtime(path) < cutoff:
+                    self._unlink(path)
+                continue
+            with open(path, "a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                if max(self._mtime(path), self._mtime(path[:-5])) < cutoff:
+                    self._unlink(path[:-5])
+                    self._unlink(path)
+
+    def _lock_file(self, lock):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.01)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.directory:
+            self._unlink(self._path(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.directory:
+            for name in os.listdir(self.directory):
+                if "." not in name:
+                    self._unlink(os.path.join(self.directory, name))
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def is_cacheable_request():
+    # Only anonymous GETs without pending flashed messages render identically for
+    # every visitor.
+    return (request.method == "GET" and current_user.is_anonymous and
+            "_flashes" not in session)
+
+
+def is_public_response(response):
+    """Whether shared caches such as a CDN may keep *response* for everyone.
+
+    Only successful anonymous GETs to PUBLIC_CACHE_ENDPOINTS qualify, and only
+    if nothing was written to the session, since that would set a cookie.
+    """
+    return (current_app.config["PUBLIC_CACHE_S_MAXAGE"] > 0 and
+            request.endpoint in current_app.config["PUBLIC_CACHE_ENDPOINTS"] and
+            response.status_code == 200 and
+            is_cacheable_request() and
+            not session.modified)
@@ -0,0 +1,145 @@
+import random
+import time
+
+from flask import current_app, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+from .metrics import metrics
+
+DRIVERS = ("pg8000", "psycopg2")
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports checkout wait times and pool usage as metrics."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.observe("db.pool.checkout_wait", time.perf_counter() - start)
+            metrics.incr("db.pool.checkouts")
+            self._record_usage()
+
+    def _do_return_conn(self, conn):
+        super()._do_return_conn(conn)
+        self._record_usage()
+
+    def _record_usage(self):
+        metrics.set("db.pool.checked_out", self.checkedout())
+        metrics.set("db.pool.overflow", max(self.overflow(), 0))
+
+
+def replica_binds(app):
+    return [f"replica{i}" for i in range(len(app.config.get("DB_REPLICA_URIS") or ()))]
+
+
+def use_replica(db_session):
+    """Decide whether the current request may read from a replica.
+
+    Only GETs to endpoints in DB_REPLICA_ENDPOINTS qualify, and never once the
+    request has written anything or while the client is inside the
+    sticky-primary window that follows one of its own writes.
+    """
+    if not has_request_context() or request.method != "GET":
+        return False
+    if request.endpoint not in current_app.config["DB_REPLICA_ENDPOINTS"]:
+        return False
+    if db_session.info.get("wrote"):
+        return False
+    return session.get("primary_until", 0) <= time.time()
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        replicas = replica_binds(self.app)
+        if replicas and not self._flushing and use_replica(self):
+            info = getattr(getattr(mapper, "mapped_table", None), "info", {})
+            if info.get("bind_key") is None:
+                metrics.incr("db.reads.replica")
+                return self.db.get_engine(self.app, bind=random.choice(replicas))
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def record_write(db_session, flush_context):
+    if db_session.new or db_session.dirty or db_session.deleted:
+        db_session.info["wrote"] = True
+
+
+def forget_writes():
+    current_app.extensions["sqlalchemy"].db.session.info.pop("wrote", None)
+
+
+def stick_to_primary(response):
+    db_session = current_app.extensions["sqlalchemy"].db.session
+    if db_session.info.pop("wrote", False):
+        window = current_app.config["DB_STICKY_PRIMARY_SECONDS"]
+        session["primary_until"] = time.time() + window
+    return response
+
+
+class Database(SQLAlchemy):
+    def init_app(self, app):
+        replicas = replica_binds(app)
+        if replicas:
+            binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+            binds.update(zip(replicas, app.config["DB_REPLICA_URIS"]))
+            app.config["SQLALCHEMY_BINDS"] = binds
+        super().init_app(app)
+        if replicas:
+            app.before_request(forget_writes)
+            app.after_request(stick_to_primary)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        super().apply_driver_hacks(app, info, options)
+        if info.drivername.startswith("sqlite"):
+            return
+        if app.config.get("SQLALCHEMY_POOL_PRE_PING"):
+            options["pool_pre_ping"] = True
+        options.setdefault("poolclass", TimedQueuePool)
+        if info.drivername == "postgresql+psycopg2":
+            # Sends executemany() as a single round trip per batch.
+            options.setdefault("use_batch_mode", True)
+
+
+def benchmark_drivers(url, drivers=DRIVERS, rows=10000, repeat=5):
+    """Time decoding *rows* rows through each installed Postgres driver.
+
+    Returns ``{driver: rows_per_second}``; drivers that are not installed map to
+    ``None``.
+    """
+    results = {}
+    for driver in drivers:
+        try:
+            __import__(driver)
+        except ImportError:
+            results[driver] = None
+            continue
+        driver_url = make_url(url)
+        driver_url.drivername = f"postgresql+{driver}"
+        engine = create_engine(driver_url)
+        with engine.connect() as connection:
+            connection.execute("CREATE TEMPORARY TABLE driver_bench "
+                               "(id SERIAL PRIMARY KEY, title TEXT, body TEXT, ts TIMESTAMP)")
+            connection.execute(
+                "INSERT INTO driver_bench (title, body, ts) "
+                "SELECT 'title ' || n, repeat('body ', 50), now() FROM generate_series(1, %s) n"
+                % int(rows))
+            start = time.perf_counter()
+            for _ in range(repeat):
+                connection.execute("SELECT id, title, body, ts FROM driver_bench").fetchall()
+            elapsed = time.perf_counter() - start
+        engine.dispose()
+        results[driver] = rows * repeat / elapsed
+    return results
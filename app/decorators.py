@@ -1,8 +1,11 @@
 from functools import wraps
+from math import ceil
 
-from flask import abort
+from flask import abort, current_app, make_response, request
 from flask_login import current_user
 
+from . import limiter
+from .counters import client_address
 from .models import Permission
 
 
@@ -21,3 +24,33 @@ def permission_required(permission):
 
 def admin_required(f):
     return permission_required(Permission.ADMIN)(f)
+
+
+def rate_limit(limit_setting, methods=("POST",), field=None):
+    """Limit requests per client, user and endpoint to the configured rate.
+
+    With *field*, requests are limited per value of that form field instead,
+    from every client. The check runs before the view, so rejected requests
+    never reach password hashing or the database.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            limit = current_app.config[limit_setting]
+            if limit and current_app.config["RATELIMIT_ENABLED"] and request.method in methods:
+                if field:
+                    value = request.form.get(field, "").strip().lower()
+                    key = value and f"{request.endpoint}:{field}:{value}"
+                else:
+                    user = current_user.get_id() if current_user.is_authenticated else "-"
+                    key = f"{request.endpoint}:{client_address()}:{user}"
+                retry_after = key and limiter.hit(current_app, key, limit)
+                if retry_after:
+                    response = make_response("Too many requests, please try again later.", 429)
+                    response.headers["Retry-After"] = str(ceil(retry_after))
+                    return response
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
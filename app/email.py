@@ -1,20 +1,28 @@
 from threading import Thread
 
 from flask import current_app, render_template
-from flask_mail import Message
 
-from . import mail
+
+def get_mail(app):
+    # Flask-Mail is only needed once something is actually sent, so it is
+    # initialised on first use instead of in create_app().
+    if "mail" not in app.extensions:
+        from flask_mail import Mail
+        Mail(app)
+    return app.extensions["mail"]
 
 
 def send_async_email(app, msg):
     with app.app_context():
-        mail.send(msg)
+        get_mail(app).send(msg)
 
 
 def send_email(to, subject, template, **kwargs):
+    from flask_mail import Message
     if not isinstance(to, list):
         to = [to]
     app = current_app._get_current_object()
+    get_mail(app)
     msg = Message(app.config["MAIL_SUBJECT_PREFIX"] + subject,
                   sender=app.config["MAIL_SENDER"],
                   recipients=to)
@@ -0,0 +1,126 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from flask import current_app
+
+from . import db
+from .counters import INTERNAL_REQUEST
+from .models import Comment, Post, RelatedPost, User
+
+MANIFEST = ".freeze-manifest.json"
+# Cheap to render and they change with every post, so always rebuilt.
+LIST_PAGES = ["/", "/blog", "/blog/archive", "/about-me", "/demos"]
+
+_client = None
+
+
+def page_path(output, url):
+    return os.path.join(output, url.strip("/"), "index.html")
+
+
+def write_page(output, url, body):
+    """Write *body* and a gzipped copy for *url*, each replaced atomically."""
+    path = page_path(output, url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for filename, data in ((path, body), (path + ".gz", gzip.compress(body, 9, mtime=0))):
+        with open(filename + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(filename + ".tmp", filename)
+
+
+def render_page(url, output):
+    """Render *url* as an anonymous visitor and write it; returns the url if written."""
+    client = _client or current_app.test_client()
+    response = client.get(url, base_url="https://localhost",
+                          environ_overrides={INTERNAL_REQUEST: True})
+    if response.status_code != 200:
+        current_app.logger.warning(f"Not freezing {url}: status {response.status_code}")
+        return None
+    write_page(output, url, response.get_data())
+    return url
+
+
+def init_worker(config_name):
+    global _client
+    from . import create_app
+    app = create_app(config_name)
+    app.app_context().push()
+    _client = app.test_client()
+
+
+def site_version():
+    """Hash of the templates, which every page depends on."""
+    digest = hashlib.sha1()
+    root = os.path.join(current_app.root_path, current_app.template_folder)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            with open(os.path.join(dirpath, name), "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def post_versions():
+    """Map every post page to a hash of everything shown on it."""
+    site = site_version()
+    comments = db.session.query(
+        Comment.post_id,
+        db.func.count(Comment.id),
+        db.func.max(Comment.edit_time),
+        db.func.sum(db.case([(Comment.disabled, 1)], else_=0)),
+        db.func.sum(User.profile_version)
+    ).outerjoin(User, User.id == Comment.author_id).group_by(Comment.post_id)
+    state = {post_id: tuple(rest) for post_id, *rest in comments}
+    related = {}
+    for post_id, slug, title in db.session.query(RelatedPost.post_id, Post.slug, Post.title)\
+                                          .join(Post, Post.id == RelatedPost.related_id)\
+                                          .order_by(RelatedPost.post_id, RelatedPost.rank):
+        related.setdefault(post_id, []).append((slug, title))
+    versions = {}
+    for post in Post.query.options(db.undefer(Post.body)).yield_per(100):
+        content = repr((site, post.title, post.body, post.timestamp, state.get(post.id),
+                        related.get(post.id)))
+        versions[f"/post/{post.slug}"] = hashlib.sha1(content.encode("utf-8")).hexdigest()
+    return versions
+
+
+def freeze(output, config_name, processes=1, force=False):
+    """Render the public pages into *output* for serving as static files.
+
+    Post pages whose version matches the manifest from the last run are
+    skipped unless *force* is set, and pages of deleted posts are removed.
+    With more than one process, pages are rendered by a pool of workers, each
+    with its own app. Returns the lists of rendered and removed urls.
+    """
+    os.makedirs(output, exist_ok=True)
+    manifest_path = os.path.join(output, MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+    versions = post_versions()
+    stale = LIST_PAGES + sorted(url for url, version in versions.items()
+                                if force or manifest.get(url) != version)
+    removed = sorted(url for url in manifest if url not in versions)
+    for url in removed:
+        shutil.rmtree(os.path.dirname(page_path(output, url)), ignore_errors=True)
+
+    if processes > 1:
+        with ProcessPoolExecutor(processes, initializer=init_worker,
+                                 initargs=(config_name,)) as pool:
+            results = list(pool.map(render_page, stale, repeat(output), chunksize=8))
+    else:
+        results = [render_page(url, output) for url in stale]
+    rendered = [url for url in results if url]
+
+    manifest = {url: version for url, version in manifest.items() if url in versions}
+    manifest.update((url, versions[url]) for url in rendered if url in versions)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return rendered, removed
@@ -0,0 +1,120 @@
+import json
+import re
+import threading
+
+from flask import current_app
+from flask_sqlalchemy import get_debug_queries
+from sqlalchemy.exc import DBAPIError
+
+from .models import Comment, Post
+
+SEQUENTIAL_SCAN = {
+    "sqlite": re.compile(r"^SCAN (?:TABLE )?\"?(\w+)\"?(?: AS \w+)?$"),
+    "postgresql": re.compile(r"Seq Scan on \"?(\w+)\"?"),
+}
+EXPLAIN = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN "}
+
+_recorded = set()
+_recorded_lock = threading.Lock()
+
+
+def record_queries(queries, path):
+    """Append the fingerprint of every statement not yet seen by this process to *path*.
+
+    Statements are already parametrised by SQLAlchemy, so the statement text is
+    the fingerprint; one set of parameters is kept so that it can be replayed.
+    """
+    with _recorded_lock:
+        new = [q for q in queries if q.statement not in _recorded]
+        if not new:
+            return
+        _recorded.update(q.statement for q in new)
+        with open(path, "a") as f:
+            for query in new:
+                f.write(json.dumps({"statement": query.statement,
+                                    "parameters": query.parameters},
+                                   default=str) + "\n")
+
+
+def log_queries():
+    """Record the request's statements to DB_QUERY_LOG and warn about slow ones."""
+    queries = get_debug_queries()
+    if queries and current_app.config["DB_QUERY_LOG"]:
+        record_queries(queries, current_app.config["DB_QUERY_LOG"])
+    for query in queries:
+        if query.duration >= current_app.config["DB_SLOW_QUERY_TIME"]:
+            current_app.logger.warning(f"Slow query: {query.statement}\n"
+                                       f"Parameters: {query.parameters}\n"
+                                       f"Duration: {query.duration}\n"
+                                       f"Context: {query.context}")
+
+
+def load_fingerprints(path):
+    fingerprints = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                fingerprints.setdefault(entry["statement"], entry["parameters"])
+    return list(fingerprints.items())
+
+
+def hot_path_fingerprints(engine):
+    """The hot ORM queries, compiled for *engine*, for when no query log exists."""
+    queries = [
+        Comment.query.filter_by(post_id=1, parent_id=None).order_by(Comment.timestamp.desc()),
+        Comment.query.filter_by(parent_id=1).order_by(Comment.timestamp.desc()),
+        Comment.query.filter_by(post_id=1),
+        Comment.query.order_by(Comment.timestamp.desc()).limit(10),
+        Comment.query.filter_by(author_id=1).order_by(Comment.timestamp.desc()),
+        Post.query.filter_by(author_id=1).order_by(Post.timestamp.desc()),
+    ]
+    fingerprints = []
+    for query in queries:
+        compiled = query.statement.compile(dialect=engine.dialect)
+        if compiled.positional:
+            parameters = [compiled.params[name] for name in compiled.positiontup]
+        else:
+            parameters = compiled.params
+        fingerprints.append((str(compiled), parameters))
+    return fingerprints
+
+
+def sequential_scans(dialect, plan):
+    tables = set()
+    for line in plan:
+        match = SEQUENTIAL_SCAN[dialect].search(line)
+        if match:
+            tables.add(match.group(1))
+    return tables
+
+
+def explain(connection, statement, parameters):
+    rows = connection.execute(EXPLAIN[connection.dialect.name] + statement, parameters or ())
+    return [row[-1] for row in rows]
+
+
+def advise(engine, fingerprints, min_rows=1000):
+    """Return ``(statement, table, row_count)`` for every sequential scan over a
+    table holding at least *min_rows* rows."""
+    dialect = engine.dialect.name
+    if dialect not in EXPLAIN:
+        raise ValueError(f"Index advice is not supported for {dialect}.")
+    advice = []
+    row_counts = {}
+    for statement, parameters in fingerprints:
+        # A failed statement aborts the transaction on Postgres, so each one
+        # gets a connection of its own.
+        with engine.connect() as connection:
+            try:
+                plan = explain(connection, statement, parameters)
+            except DBAPIError as e:
+                current_app.logger.warning(f"Could not explain {statement!r}: {e}")
+                continue
+            for table in sorted(sequential_scans(dialect, plan)):
+                if table not in row_counts:
+                    row_counts[table] = connection.execute(
+                        f'SELECT count(*) FROM "{table}"').scalar()
+                if row_counts[table] >= min_rows:
+                    advice.append((statement, table, row_counts[table]))
+    return advice
@@ -0,0 +1,265 @@
+import fcntl
+import json
+import os
+import random
+import select
+import threading
+import time
+from collections import deque
+from importlib import import_module
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, or_
+
+from .database import RoutingSession
+from .metrics import metrics
+
+# Received when a worker may have missed events; its handlers should drop everything.
+RESET = "*"
+
+
+def queue_invalidation(db_session, kind, id):
+    """Publish ``(kind, id)`` to every worker once *db_session* commits."""
+    if db_session is not None:
+        db_session.info.setdefault("invalidations", set()).add((kind, id))
+
+
+@event.listens_for(RoutingSession, "after_soft_rollback")
+def discard_invalidations(db_session, previous_transaction):
+    db_session.info.pop("invalidations", None)
+
+
+class LocalBackend():
+    """For a single process: events come back on its own next poll."""
+
+    def __init__(self, app):
+        self._events = deque()
+
+    def publish(self, events):
+        self._events.extend(events)
+
+    def receive(self):
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        return events
+
+
+class FileBackend():
+    """An append-only log shared by every worker on the machine.
+
+    Each worker remembers how far it has read. The log is emptied once it
+    outgrows INVALIDATION_FILE_MAX_SIZE; workers that notice then reset.
+    """
+
+    def __init__(self, app):
+        self.path = app.config["INVALIDATION_FILE"]
+        self.max_size = app.config["INVALIDATION_FILE_MAX_SIZE"]
+        self.offset = None
+
+    def publish(self, events):
+        with open(self.path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if os.fstat(f.fileno()).st_size > self.max_size:
+                f.truncate(0)
+            f.write("".join(json.dumps(e) + "\n" for e in events).encode("utf-8"))
+
+    def receive(self):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return []
+        with f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            size = os.fstat(f.fileno()).st_size
+            if self.offset is None:
+                self.offset = size
+                return []
+            events = []
+            if size < self.offset:
+                events.append((RESET, None, time.time()))
+                self.offset = 0
+            f.seek(self.offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        self.offset += len(complete)
+        events.extend(tuple(json.loads(line)) for line in complete.splitlines())
+        return events
+
+
+class DatabaseBackend():
+    """Rows in the invalidation table.
+
+    Works wherever every worker shares the database, e.g. across App Engine
+    instances. A transaction can commit its row after one with a higher id has
+    been read, so each poll also re-reads the rows published in the last
+    INVALIDATION_LOOKBACK seconds and skips the ids it has already seen. Rows
+    older than INVALIDATION_RETENTION seconds are pruned.
+    """
+
+    def __init__(self, app):
+        self.retention = app.config["INVALIDATION_RETENTION"]
+        self.lookback = app.config["INVALIDATION_LOOKBACK"]
+        self.last_id = None
+        self.seen = set()
+
+    def publish(self, events):
+        from .models import Invalidation
+        table = Invalidation.__table__
+        with current_app.extensions["sqlalchemy"].db.engine.begin() as connection:
+            connection.execute(table.insert(), [
+                {"kind": kind, "object_id": id, "published": published}
+                for kind, id, published in events])
+            if random.random() < 0.01:
+                connection.execute(table.delete().where(
+                    table.c.published < time.time() - self.retention))
+
+    def receive(self):
+        from .models import Invalidation
+        table = Invalidation.__table__
+        since = time.time() - self.lookback
+        with current_app.extensions["sqlalchemy"].db.engine.connect() as connection:
+            starting = self.last_id is None
+            if starting:
+                # A worker starts with empty caches, so only later events matter.
+                self.last_id = connection.execute(func.max(table.c.id).select()).scalar() or 0
+                condition = table.c.published > since
+            else:
+                condition = or_(table.c.id > self.last_id, table.c.published > since)
+            rows = connection.execute(table.select().where(condition)
+                                                    .order_by(table.c.id)).fetchall()
+        seen, self.seen = self.seen, {row.id for row in rows if row.published > since}
+        self.last_id = max([self.last_id] + [row.id for row in rows])
+        if starting:
+            return []
+        return [(row.kind, row.object_id, row.published) for row in rows if row.id not in seen]
+
+
+class PostgresBackend():
+    """Postgres LISTEN/NOTIFY; needs psycopg2.
+
+    A daemon thread, started in each worker on its first poll, listens on its
+    own connection. Events sent while it reconnects are lost, so it publishes
+    a reset once it is listening again.
+    """
+
+    def __init__(self, app):
+        self.engine = app.extensions["sqlalchemy"].db.get_engine(app)
+        if self.engine.dialect.driver != "psycopg2":
+            raise ValueError("The postgres invalidation backend needs psycopg2.")
+        self.channel = app.config["INVALIDATION_CHANNEL"]
+        self.logger = app.logger
+        self._received = deque(maxlen=10000)
+        self._thread = None
+
+    def publish(self, events):
+        with self.engine.connect() as connection:
+            for e in events:
+                connection.execute("SELECT pg_notify(%s, %s)", (self.channel, json.dumps(e)))
+
+    def receive(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._listen, daemon=True)
+            self._thread.start()
+        events = []
+        while self._received:
+            events.append(self._received.popleft())
+        return events
+
+    def _listen(self):
+        while True:
+            try:
+                connection = self.engine.raw_connection()
+                connection.detach()
+                dbapi_connection = connection.connection
+                dbapi_connection.autocommit = True
+                dbapi_connection.cursor().execute(f"LISTEN {self.channel}")
+                self._received.append((RESET, None, time.time()))
+                while True:
+                    if select.select([dbapi_connection], [], [], 5) == ([], [], []):
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        notify = dbapi_connection.notifies.pop(0)
+                        self._received.append(tuple(json.loads(notify.payload)))
+            except Exception:
+                self.logger.exception("Invalidation listener failed; reconnecting.")
+                metrics.incr("invalidation.errors")
+                time.sleep(5)
+
+
+BACKENDS = {
+    "local": LocalBackend,
+    "file": FileBackend,
+    "database": DatabaseBackend,
+    "postgres": PostgresBackend
+}
+
+
+class InvalidationBus():
+    """Carries ``(kind, id)`` invalidations between workers.
+
+    Committed writes are published through the configured backend; every worker
+    polls for new events at most once per INVALIDATION_POLL_SECONDS, before a
+    request, and passes them to the handlers subscribed to that kind, so its
+    caches are never staler than that.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self._lock = threading.Lock()
+        event.listen(RoutingSession, "after_commit", self.publish_queued)
+
+    def init_app(self, app):
+        backend = app.config["INVALIDATION_BACKEND"]
+        if backend in BACKENDS:
+            backend_class = BACKENDS[backend]
+        else:
+            module, _, name = backend.partition(":")
+            backend_class = getattr(import_module(module), name)
+        backend = backend_class(app)
+        backend.next_poll = 0
+        app.extensions["invalidation"] = backend
+        app.before_request(self.poll_if_due)
+
+    def subscribe(self, kind, handler):
+        self.handlers.setdefault(kind, []).append(handler)
+
+    def publish_queued(self, db_session):
+        events = db_session.info.pop("invalidations", None)
+        if events and has_app_context():
+            self.publish(sorted(events))
+
+    def publish(self, events):
+        now = time.time()
+        events = [(kind, id, now) for kind, id in events]
+        try:
+            current_app.extensions["invalidation"].publish(events)
+        except Exception:
+            current_app.logger.exception("Could not publish cache invalidations.")
+            metrics.incr("invalidation.errors")
+            return
+        metrics.incr("invalidation.published", len(events))
+
+    def poll(self):
+        backend = current_app.extensions["invalidation"]
+        with self._lock:
+            try:
+                events = backend.receive()
+            except Exception:
+                current_app.logger.exception("Could not receive cache invalidations.")
+                metrics.incr("invalidation.errors")
+                return
+        now = time.time()
+        for kind, id, published in events:
+            metrics.observe("invalidation.lag", max(now - published, 0))
+            for handler in self.handlers.get(kind, ()):
+                handler(id)
+        metrics.incr("invalidation.received", len(events))
+
+    def poll_if_due(self):
+        backend = current_app.extensions["invalidation"]
+        now = time.monotonic()
+        if now >= backend.next_poll:
+            backend.next_poll = now + current_app.config["INVALIDATION_POLL_SECONDS"]
+            self.poll()
@@ -54,3 +54,22 @@ class PostForm(FlaskForm):
 class CommentForm(FlaskForm):
     body = TextAreaField("Leave a comment here.", validators=[validators.DataRequired()])
     submit = SubmitField("Submit")
+
+
+class BulkModerationForm(FlaskForm):
+    scope = SelectField("Apply to",
+                        choices=[("selected", "Selected comments"),
+                                 ("author", "All comments by author"),
+                                 ("filter", "All comments containing")])
+    author = StringField("Author")
+    contains = StringField("Containing")
+    enable = SubmitField("Enable")
+    disable = SubmitField("Disable")
+
+    def validate_author(self, field):
+        if self.scope.data == "author" and not User.query.filter_by(username=field.data).first():
+            raise wtforms.ValidationError("Unknown user.")
+
+    def validate_contains(self, field):
+        if self.scope.data == "filter" and not field.data:
+            raise wtforms.ValidationError("Enter the text to match.")
@@ -1,18 +1,32 @@
-from flask import (abort, current_app, flash, redirect, render_template, request, url_for)
+from datetime import MAXYEAR, MINYEAR, datetime, timedelta
+
+from flask import (Markup, abort, current_app, flash, g, jsonify, redirect,
+                   render_template, request, url_for)
 from flask_login import current_user, login_required
-from flask_sqlalchemy import get_debug_queries
 
-from .. import db
-from ..decorators import admin_required, permission_required
+from .. import db, fragment_cache, page_cache, view_counter
+from ..cache import is_cacheable_request, is_public_response
+from ..counters import client_address, popular_posts
+from ..decorators import admin_required, permission_required, rate_limit
+from ..indexes import log_queries
+from ..metrics import metrics
+from ..rollups import archive_months, month_starts, series, totals
+from ..streaming import stream_template
+from ..threads import ThreadNode, load_replies, load_roots, load_subtree, with_author
 from ..models import Comment, Demo, Image, Permission, Post, Role, User
+from ..queries import comment_by_id, or_404, post_by_slug, user_by_username
+from ..warmup import warm_up
 from . import main
-from .forms import CommentForm, EditProfileAdminForm, EditProfileForm, PostForm
+from .forms import (BulkModerationForm, CommentForm, EditProfileAdminForm, EditProfileForm,
+                    PostForm)
 
 
 @main.route("/", methods=["GET", "POST"])
 def index():
-    form = PostForm()
-    if current_user.can(Permission.WRITE) and form.validate_on_submit():
+    # Building a form issues a CSRF token into the session, which would keep
+    # anonymous pages out of shared caches.
+    form = PostForm() if current_user.can(Permission.WRITE) else None
+    if form and form.validate_on_submit():
         post = Post(body=form.body.data, author=current_user._get_current_object())
         db.session.add(post)
         db.session.commit()
@@ -21,41 +35,97 @@ def index():
     pagination = Post.query.order_by(Post.timestamp.desc()).paginate(
         page, per_page=current_app.config["POSTS_PER_PAGE"], error_out=False)
     posts = pagination.items
-    return render_template("index.html.j2", posts=posts, form=form, pagination=pagination)
+    popular = page_cache.get_or_compute(("popular",), lambda: render_template(
+        "_popular.html.j2", posts=popular_posts(current_app.config["POPULAR_POSTS"])))
+    return render_template("index.html.j2", posts=posts, form=form, pagination=pagination,
+                           popular=popular)
 
 
 @main.route("/user/<username>")
 @login_required
 def user(username):
-    user = User.query.filter_by(username=username).first_or_404()
-    posts = user.posts.order_by(Post.timestamp.desc()).all()
-    return render_template("user.html.j2", user=user, posts=posts)
+    user = or_404(user_by_username(username))
+    page = request.args.get("page", 1, type=int)
+    pagination = user.posts.order_by(Post.timestamp.desc()).paginate(
+        page, per_page=current_app.config["POSTS_PER_PAGE"], error_out=False)
+    posts = pagination.items
+    return render_template("user.html.j2", user=user, posts=posts, pagination=pagination)
 
 
 @main.route("/post/<slug>", methods=["GET", "POST"])
+@rate_limit("RATELIMIT_COMMENT")
 def post(slug):
-    post = Post.query.filter_by(slug=slug).first()
-    if not post:
-        abort(404)
+    post = or_404(post_by_slug(slug, body=True))
+    if request.method == "GET":
+        view_counter.record(post.id)
+    if not current_user.is_authenticated:
+        if request.method == "POST":
+            return current_app.login_manager.unauthorized()
+        if is_cacheable_request():
+            return page_cache.get_or_compute(("post", post.id), lambda: render_post(post))
+        return render_post(post)
     form = CommentForm()
     if form.validate_on_submit():
-        if not current_user.is_authenticated:
-            return current_app.login_manager.unauthorized()
         comment = Comment(author=current_user._get_current_object(), post=post, body=form.body.data)
         db.session.add(comment)
         db.session.commit()
         flash("Comment added.")
         return redirect(url_for(".post", slug=post.slug, page=-1))
-    comments = post.comments.filter_by(parent=None).order_by(Comment.timestamp.desc())
-    return render_template("post.html.j2", post=post, form=form, comments=comments)
+    return render_post(post, form, stream=current_app.config["STREAM_TEMPLATES"])
+
+
+@main.app_template_global()
+def comment_fragment(comment, moderate=False):
+    """Render the author block and body of *comment*, which look the same to
+    every viewer, from the fragment cache."""
+    show_body = moderate or not comment.disabled
+    key = ("comment", comment.id, comment.edit_time, comment.disabled, show_body,
+           comment.author_id, comment.author and comment.author.profile_version)
+    html = fragment_cache.get(key)
+    if html is None:
+        html = Markup(render_template("_comment.html.j2", comment=comment, show_body=show_body))
+        fragment_cache.set(key, html)
+    return html
+
+
+def render_post(post, form=None, stream=False):
+    def comments():
+        # Called by the template, so a streamed page has sent its head and the
+        # post body before the comment queries run.
+        nodes, cursor = load_roots(post)
+        return nodes, cursor and url_for(".post_comments", slug=post.slug, after=cursor)
+
+    render = stream_template if stream else render_template
+    return render("post.html.j2",
+                  post=post,
+                  related=post.related(),
+                  form=form,
+                  comments=comments)
+
+
+@main.route("/post/<slug>/comments")
+def post_comments(slug):
+    post = or_404(post_by_slug(slug))
+    nodes, cursor = load_roots(post, request.args.get("after"))
+    return render_template("_thread.html.j2",
+                           nodes=nodes,
+                           more_url=cursor and url_for(".post_comments", slug=slug, after=cursor))
+
+
+@main.route("/comment/<int:id>/replies")
+def comment_replies(id):
+    parent = or_404(comment_by_id(id))
+    nodes, cursor = load_replies(parent, request.args.get("after"))
+    return render_template("_thread.html.j2",
+                           nodes=nodes,
+                           more_url=cursor and url_for(".comment_replies", id=id, after=cursor),
+                           more_label="More replies")
 
 
 @main.route("/post/edit/<slug>", methods=["GET", "POST"])
 @login_required
 def edit_post(slug):
-    post = Post.query.filter_by(slug=slug).first()
-    if not post:
-        abort(404)
+    post = or_404(post_by_slug(slug, body=True))
     if not (current_user.is_admin() or current_user == post.author):
         abort(403)
     form = PostForm()
@@ -71,7 +141,7 @@ def edit_post(slug):
 
 @main.route("/comment/edit/<int:id>", methods=["GET", "POST"])
 def edit_comment(id):
-    comment = Comment.query.get_or_404(id)
+    comment = or_404(comment_by_id(id))
     if not (current_user.can(Permission.MODERATE) or current_user == comment.author):
         abort(403)
     form = CommentForm()
@@ -87,8 +157,9 @@ def edit_comment(id):
 
 @main.route("/comment/reply/<int:id>", methods=["GET", "POST"])
 @login_required
+@rate_limit("RATELIMIT_COMMENT")
 def reply_to_comment(id):
-    parent = Comment.query.get_or_404(id)
+    parent = or_404(comment_by_id(id))
     form = CommentForm()
     if form.validate_on_submit():
         comment = Comment(author=current_user._get_current_object(),
@@ -99,14 +170,44 @@ def reply_to_comment(id):
         db.session.commit()
         flash("Comment created.")
         return redirect(url_for(".post", slug=comment.post.slug))
-    return render_template("comment.html.j2", form=form, comments=[parent])
+    thread = load_subtree(parent, current_app.config["COMMENT_THREAD_DEPTH"])
+    return render_template("comment.html.j2", form=form, nodes=[thread])
 
 
 @main.route("/admin")
 @login_required
 @admin_required
-def for_admins_only():
-    return "My admin page."
+def dashboard():
+    today = datetime.utcnow().date()
+    days = [today - timedelta(days=n) for n in range(current_app.config["DASHBOARD_DAYS"])][::-1]
+    months = month_starts(today, current_app.config["DASHBOARD_MONTHS"])
+    return render_template("dashboard.html.j2",
+                           days=days,
+                           daily=series("day", days),
+                           months=months,
+                           monthly=series("month", months),
+                           totals=totals())
+
+
+@main.route("/admin/metrics")
+@login_required
+@admin_required
+def admin_metrics():
+    return jsonify(metrics.snapshot())
+
+
+@main.route("/admin/memory")
+@login_required
+@admin_required
+def admin_memory():
+    profiler = current_app.extensions.get("memory_profiler")
+    if profiler is None:
+        abort(404)
+    report = profiler.report(request.args.get("top", current_app.config["MEMORY_PROFILE_TOP"],
+                                              type=int))
+    if request.args.get("dump", 0, type=int):
+        report["dump"] = profiler.dump()
+    return jsonify(report)
 
 
 @main.route("/moderate")
@@ -114,18 +215,54 @@ def for_admins_only():
 @permission_required(Permission.MODERATE)
 def moderate():
     page = request.args.get("page", 1, type=int)
-    pagination = Comment.query.order_by(Comment.timestamp.desc()).paginate(
+    unreviewed = request.args.get("unreviewed", 0, type=int)
+    query = Comment.query.options(with_author)
+    if unreviewed:
+        query = query.filter_by(reviewed=False)
+    pagination = query.order_by(Comment.timestamp.desc()).paginate(
         page, per_page=current_app.config["COMMENTS_PER_PAGE"], error_out=False)
     comments = pagination.items
-    return render_template("moderate.html.j2", comments=comments, pagination=pagination, page=page)
+    render = stream_template if current_app.config["STREAM_TEMPLATES"] else render_template
+    return render("moderate.html.j2",
+                  nodes=[ThreadNode(c) for c in comments],
+                  pagination=pagination,
+                  page=page,
+                  unreviewed=unreviewed,
+                  form=BulkModerationForm())
+
+
+@main.route("/moderate/bulk", methods=["POST"])
+@login_required
+@permission_required(Permission.MODERATE)
+def bulk_moderate():
+    form = BulkModerationForm()
+    if form.validate_on_submit():
+        query = Comment.query
+        if form.scope.data == "author":
+            author = User.query.filter_by(username=form.author.data).first()
+            query = query.filter_by(author_id=author.id)
+        elif form.scope.data == "filter":
+            query = query.filter(Comment.body.contains(form.contains.data, autoescape=True))
+        else:
+            query = query.filter(Comment.id.in_(request.form.getlist("ids", type=int)))
+        count = Comment.moderate(query, disabled=form.disable.data)
+        db.session.commit()
+        flash(f"{count} comments {'disabled' if form.disable.data else 'enabled'}.")
+    else:
+        for errors in form.errors.values():
+            flash(errors[0])
+    return redirect(url_for(".moderate",
+                            page=request.args.get("page", 1, type=int),
+                            unreviewed=request.args.get("unreviewed", 0, type=int)))
 
 
 @main.route("/moderate/enable/<int:id>")
 @login_required
 @permission_required(Permission.MODERATE)
 def enable_comment(id):
-    comment = Comment.query.get_or_404(id)
+    comment = or_404(comment_by_id(id))
     comment.disabled = False
+    comment.reviewed = True
     db.session.add(comment)
     db.session.commit()
     return redirect(url_for('.moderate', page=request.args.get("page", 1, type=int)))
@@ -135,8 +272,9 @@ def enable_comment(id):
 @login_required
 @permission_required(Permission.MODERATE)
 def disable_comment(id):
-    comment = Comment.query.get_or_404(id)
+    comment = or_404(comment_by_id(id))
     comment.disabled = True
+    comment.reviewed = True
     db.session.add(comment)
     db.session.commit()
     return redirect(url_for('.moderate', page=request.args.get("page", 1, type=int)))
@@ -188,6 +326,13 @@ def edit_profile_admin(id):
     return render_template("edit-profile.html.j2", form=form, user=user)
 
 
+@main.route("/_ah/warmup")
+def warmup():
+    if not (client_address() or "").startswith(current_app.config["WARMUP_ADDRESS_PREFIX"]):
+        abort(404)
+    return jsonify(warm_up())
+
+
 @main.route("/shutdown")
 def server_shutdown():
     if not current_app.testing:
@@ -201,13 +346,13 @@ def server_shutdown():
 
 @main.route("/demos")
 def demos():
-    demos = Demo.query.all()
-    return render_template("demos.html.j2", demos)
+    demos = Demo.query.options(db.joinedload(Demo.thumbnail)).all()
+    return render_template("demos.html.j2", demos=demos)
 
 
 @main.route("/img/<filename>")
 def image(filename):
-    img = Image.query.filter_by(filename=filename).first()
+    img = Image.query.options(db.undefer(Image.data)).filter_by(filename=filename).first()
     return img.data
 
 
@@ -225,12 +370,45 @@ def blog():
     return render_template("blog.html.j2", posts=posts, pagination=pagination)
 
 
+@main.route("/blog/archive")
+def archive():
+    return render_template("archive.html.j2", months=archive_months())
+
+
+@main.route("/blog/<int:year>/<int:month>")
+def blog_month(year, month):
+    # The end of the month must fit in a datetime too.
+    if not (1 <= month <= 12 and MINYEAR <= year < MAXYEAR):
+        abort(404)
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    page = request.args.get("page", 1, type=int)
+    pagination = Post.query.filter(Post.timestamp >= start, Post.timestamp < end)\
+                           .order_by(Post.timestamp.desc()).paginate(
+        page, per_page=current_app.config["POSTS_PER_PAGE"], error_out=False)
+    return render_template("blog.html.j2", posts=pagination.items, pagination=pagination,
+                           month=start)
+
+
+@main.after_app_request
+def cache_control(response):
+    if "Cache-Control" in response.headers:
+        return response
+    if is_public_response(response):
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config["PUBLIC_CACHE_MAX_AGE"]
+        response.cache_control.s_maxage = current_app.config["PUBLIC_CACHE_S_MAXAGE"]
+    else:
+        response.cache_control.private = True
+    # Visitors with a session cookie may be logged in, so must not get the
+    # shared copy.
+    response.vary.add("Cookie")
+    return response
+
+
 @main.after_app_request
 def after_request(response):
-    for query in get_debug_queries():
-        if query.duration >= current_app.config["DB_SLOW_QUERY_TIME"]:
-            current_app.logger.warning(f"Slow query: {query.statement}\n"
-                                       f"Parameters: {query.parameters}\n"
-                                       f"Duration: {query.duration}\n"
-                                       f"Context: {query.context}")
+    # Streamed pages are still running queries; they are logged once sent.
+    if not g.get("streaming"):
+        log_queries()
     return response
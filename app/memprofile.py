@@ -0,0 +1,127 @@
+import os
+import random
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from flask import g, request
+
+FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>")
+]
+MAX_SITES = 100
+
+
+def take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces(FILTERS)
+
+
+def site(stat):
+    frame = stat.traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+class MemoryProfiler():
+    """Attributes memory growth to endpoints by snapshotting around sampled requests.
+
+    Turned on with MEMORY_PROFILE_ENABLED, which starts tracemalloc with
+    MEMORY_PROFILE_FRAMES frames per allocation for the life of the worker.
+    Only one request is sampled at a time, and other threads allocate during
+    it too, so a site needs several samples before its total means much.
+    Peak memory is only measured on Python 3.9 and later.
+    """
+
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        self._sampling = threading.Lock()
+
+    def init_app(self, app):
+        if not app.config["MEMORY_PROFILE_ENABLED"]:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(app.config["MEMORY_PROFILE_FRAMES"])
+        self.sample_rate = app.config["MEMORY_PROFILE_SAMPLE_RATE"]
+        self.directory = app.config["MEMORY_PROFILE_DIRECTORY"]
+        app.extensions["memory_profiler"] = self
+        app.before_request(self.start)
+        app.teardown_request(self.finish)
+
+    def start(self):
+        if random.random() >= self.sample_rate or not self._sampling.acquire(blocking=False):
+            return
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        g.memory_profile = (take_snapshot(), tracemalloc.get_traced_memory()[0])
+
+    def finish(self, exc=None):
+        started = g.pop("memory_profile", None)
+        if started is None:
+            return
+        try:
+            before, traced = started
+            current, peak = tracemalloc.get_traced_memory()
+            growth = take_snapshot().compare_to(before, "lineno")
+            self.record(request.endpoint or "-", current - traced,
+                        peak - traced if hasattr(tracemalloc, "reset_peak") else None,
+                        {site(stat): stat.size_diff for stat in growth if stat.size_diff > 0})
+        finally:
+            self._sampling.release()
+
+    def record(self, endpoint, delta, peak, sites):
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {
+                    "samples": 0, "delta": 0, "max_delta": 0, "max_peak": None, "sites": Counter()
+                }
+            stats["samples"] += 1
+            stats["delta"] += delta
+            stats["max_delta"] = max(stats["max_delta"], delta)
+            if peak is not None:
+                stats["max_peak"] = max(stats["max_peak"] or 0, peak)
+            stats["sites"].update(sites)
+            if len(stats["sites"]) > MAX_SITES:
+                stats["sites"] = Counter(dict(stats["sites"].most_common(MAX_SITES)))
+
+    def report(self, top=20):
+        """Current traced memory, its top allocation sites, and the growth per endpoint."""
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            endpoints = {
+                endpoint: dict(stats, sites=stats["sites"].most_common(top))
+                for endpoint, stats in self.endpoints.items()
+            }
+        return {
+            "traced": current,
+            "peak": peak,
+            "top": [(site(stat), stat.size, stat.count)
+                    for stat in take_snapshot().statistics("lineno")[:top]],
+            "endpoints": endpoints
+        }
+
+    def dump(self):
+        """Write a snapshot for flask memory-report; returns its path."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{int(time.time())}-{os.getpid()}.tracemalloc")
+        take_snapshot().dump(path)
+        return path
+
+
+def format_report(path, compare=None, top=20, key_type="lineno"):
+    """Yield the lines of flask memory-report for the snapshot dump at *path*."""
+    snapshot = tracemalloc.Snapshot.load(path)
+    if compare:
+        stats = snapshot.compare_to(tracemalloc.Snapshot.load(compare), key_type)
+    else:
+        stats = snapshot.statistics(key_type)
+    total = sum(stat.size for stat in stats)
+    yield f"{len(stats)} allocation sites, {total / 1024:.1f} KiB traced."
+    for stat in stats[:top]:
+        yield str(stat)
+        if key_type == "traceback":
+            yield from (f"    {line}" for line in stat.traceback.format())
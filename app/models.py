@@ -2,14 +2,17 @@ import re
 from datetime import datetime
 from hashlib import md5
 
-import bleach
-from flask import current_app, url_for
+from flask import current_app, has_app_context, url_for
 from flask_login import AnonymousUserMixin, UserMixin
 from itsdangerous import BadData, TimedJSONWebSignatureSerializer
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 from werkzeug.security import check_password_hash, generate_password_hash
 
-from app import db, login
+from app import bus, db, login, page_cache
 from app.exceptions import ValidationError
+from app.invalidation import RESET, queue_invalidation
 
 
 class User(UserMixin, db.Model):
@@ -26,14 +29,23 @@ class User(UserMixin, db.Model):
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
     posts = db.relationship("Post", backref="author", lazy="dynamic")
     comments = db.relationship("Comment", backref="author", lazy="dynamic")
+    # Kept up to date by the Post and Comment mapper events below.
+    post_count = db.Column(db.Integer, default=0)
+    comment_count = db.Column(db.Integer, default=0)
+    last_activity = db.Column(db.DateTime())
+    # Set whenever the email changes so avatar() need not hash it on every render.
+    avatar_hash = db.Column(db.String(32))
+    # Bumped whenever something shown beside the user's comments changes; part
+    # of the comment fragment cache key.
+    profile_version = db.Column(db.Integer, default=0)
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         if self.role is None:
             if self.email == current_app.config["ADMIN_ADDRESS"]:
-                self.role = Role.query.filter_by(name="admin").first()
+                self.role = Role.cached("admin")
             if self.role is None:
-                self.role = Role.query.filter_by(default=True).first()
+                self.role = Role.cached()
 
     @property
     def password(self):
@@ -75,8 +87,20 @@ class User(UserMixin, db.Model):
             return None
         return User.query.get(data["id"])
 
+    @staticmethod
+    def email_hash(email):
+        return md5(email.lower().encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def on_change_profile(target, value, oldvalue, initiator):
+        if value == oldvalue:
+            return
+        if initiator.key == "email":
+            target.avatar_hash = value and User.email_hash(value)
+        target.profile_version = (target.profile_version or 0) + 1
+
     def avatar(self, size):
-        digest = md5(self.email.lower().encode("utf-8")).hexdigest()
+        digest = self.avatar_hash or User.email_hash(self.email)
         return f"https://www.gravatar.com/avatar/{digest}?d=identicon&s={size}"
 
     def can(self, perm):
@@ -97,7 +121,7 @@ class User(UserMixin, db.Model):
             "member_since": self.member_since,
             "last_seen": self.last_seen,
             "posts_url": url_for("api.get_user_posts", id=self.id),
-            "post_count": self.posts.count()
+            "post_count": self.post_count
         }
         return user
 
@@ -139,6 +163,27 @@ class Role(db.Model):
     def has_permission(self, perm):
         return self.permissions & perm == perm
 
+    @staticmethod
+    def cached(name=None):
+        """The role called *name*, or the default role, without a query once seen.
+
+        The app keeps a detached copy of each role for its lifetime, merged into
+        the session on every call; committed role changes clear it in every
+        worker through the invalidation bus.
+        """
+        roles = current_app.extensions.setdefault("roles", {})
+        role = roles.get(name)
+        if role is None:
+            query = Role.query.filter_by(name=name) if name else Role.query.filter_by(default=True)
+            found = query.first()
+            if found is None:
+                return None
+            role = Role(id=found.id, name=found.name, default=found.default,
+                        permissions=found.permissions)
+            make_transient_to_detached(role)
+            roles[name] = role
+        return db.session.merge(role, load=False)
+
     @staticmethod
     def insert_roles():
         roles = {
@@ -178,15 +223,40 @@ class Post(db.Model):
     title = db.Column(db.String(128))
     slug = db.Column(db.Text, index=True, unique=True)
     author_id = db.Column(db.Integer, db.ForeignKey("user.id"))
-    body = db.Column(db.Text)
+    # Large columns are deferred so list views never load them; detail views
+    # undefer them explicitly.
+    body = db.deferred(db.Column(db.Text))
     summary = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     comments = db.relationship("Comment", backref="post", lazy="dynamic")
+    # Digest of the title and body the related posts were last computed from.
+    related_digest = db.Column(db.String(40))
+
+    __table_args__ = (db.Index("ix_post_author_id_timestamp", "author_id", "timestamp"),)
+
+    def related(self):
+        """Return ``(slug, title)`` of the precomputed related posts, best first."""
+        return db.session.query(Post.slug, Post.title)\
+                         .join(RelatedPost, RelatedPost.related_id == Post.id)\
+                         .filter(RelatedPost.post_id == self.id)\
+                         .order_by(RelatedPost.rank).all()
 
     def __repr__(self):
         return f"<Post {self.author_id}, {self.timestamp}>"
 
 
+class RelatedPost(db.Model):
+    """The most similar posts to each post; written by flask related-posts."""
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id", ondelete="CASCADE"),
+                        primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    related_id = db.Column(db.Integer, db.ForeignKey("post.id", ondelete="CASCADE"))
+    score = db.Column(db.Float)
+
+
+PATH_SEGMENT_WIDTH = 10
+
+
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     post_id = db.Column(db.Integer, db.ForeignKey("post.id"))
@@ -194,19 +264,98 @@ class Comment(db.Model):
     body = db.Column(db.Text)
     body_html = db.Column(db.Text)
     disabled = db.Column(db.Boolean, default=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     edit_time = db.Column(db.DateTime)
-    parent_id = db.Column(db.Integer, db.ForeignKey("comment.id"), index=True)
+    parent_id = db.Column(db.Integer, db.ForeignKey("comment.id"))
     parent = db.relationship("Comment", remote_side=id, backref="children")
+    reviewed = db.Column(db.Boolean, default=False)
+    # Materialized path: the zero-padded ids of every ancestor and then this
+    # comment, so a subtree in display order is one range scan. Set after insert.
+    path = db.Column(db.Text)
+    depth = db.Column(db.Integer)
+
+    # Comments are listed per post and per parent newest first, by author on
+    # profile pages and by review state in the moderation queue.
+    __table_args__ = (
+        db.Index("ix_comment_post_id_parent_id_timestamp", "post_id", "parent_id", "timestamp"),
+        db.Index("ix_comment_parent_id_timestamp", "parent_id", "timestamp"),
+        db.Index("ix_comment_author_id_timestamp", "author_id", "timestamp"),
+        db.Index("ix_comment_reviewed_timestamp", "reviewed", "timestamp"),
+        db.Index("ix_comment_path", "path", postgresql_ops={"path": "text_pattern_ops"}),
+    )
 
     @staticmethod
     def on_change_body(target, value, oldvalue, initiator):
-        if not target.edit_time:
-            target.edit_time = datetime.utcnow()
+        import bleach
+        # Part of the comment fragment cache key, so it changes on every edit.
+        target.edit_time = datetime.utcnow()
         r = re.compile(r"\n+")
         target.body_html = "<p>" + bleach.linkify(
             r.sub("</p><p>", bleach.clean(value.strip(), tags=[]))) + "</p>"
 
+    @staticmethod
+    def path_segment(id):
+        return str(id).zfill(PATH_SEGMENT_WIDTH)
+
+    def subtree(self, depth=None):
+        """Query the replies below this comment in display order: every reply
+        straight after its parent, siblings oldest first. With *depth*, only
+        replies at most that many levels down are included."""
+        # Paths only contain digits, so everything below this comment sorts
+        # between its path and its path plus one. The LIKE lets Postgres use
+        # the text_pattern_ops index whatever the collation.
+        upper = str(int(self.path) + 1).zfill(len(self.path))
+        query = Comment.query.filter(Comment.path.like(self.path + "%"),
+                                     Comment.path > self.path,
+                                     Comment.path < upper)
+        if depth is not None:
+            query = query.filter(Comment.depth <= self.depth + depth)
+        return query.order_by(Comment.path)
+
+    @staticmethod
+    def backfill_paths(batch_size=1000):
+        """Set path and depth on every comment; returns the number updated."""
+        comments = Comment.__table__
+        paths = {}
+        last_id = 0
+        update = comments.update().where(comments.c.id == db.bindparam("comment_id"))\
+                                  .values(path=db.bindparam("new_path"),
+                                          depth=db.bindparam("new_depth"))
+        while True:
+            rows = db.session.execute(
+                db.select([comments.c.id, comments.c.parent_id])
+                  .where(comments.c.id > last_id)
+                  .order_by(comments.c.id)
+                  .limit(batch_size)).fetchall()
+            if not rows:
+                return len(paths)
+            values = []
+            for id, parent_id in rows:
+                # Replies are always created after their parent, so the parent
+                # has already been seen.
+                parent_path, parent_depth = paths.get(parent_id, ("", -1))
+                paths[id] = (parent_path + Comment.path_segment(id), parent_depth + 1)
+                values.append({"comment_id": id, "new_path": paths[id][0],
+                               "new_depth": paths[id][1]})
+            db.session.execute(update, values)
+            db.session.commit()
+            last_id = rows[-1][0]
+
+    @staticmethod
+    def moderate(query, disabled):
+        """Enable or disable every comment matched by *query* with a single UPDATE.
+
+        Bulk updates skip the mapper events, so the cached pages of the affected
+        posts are invalidated here. Returns the number of comments updated.
+        """
+        post_ids = [post_id for post_id, in query.with_entities(Comment.post_id).distinct()]
+        count = query.update({"disabled": disabled, "reviewed": True}, synchronize_session=False)
+        increment_rollups(db.session.connection(), "moderations", datetime.utcnow(), count)
+        for post_id in post_ids:
+            page_cache.delete(("post", post_id))
+            queue_invalidation(db.session(), "post", post_id)
+        return count
+
     def __repr__(self):
         return f"<Comment {self.id}>"
 
@@ -216,7 +365,7 @@ class Demo(db.Model):
     title = db.Column(db.Text)
     slug = db.Column(db.Text, index=True)
     summary = db.Column(db.Text)
-    body = db.Column(db.Text)
+    body = db.deferred(db.Column(db.Text))
     thumbnail_id = db.Column(db.Integer, db.ForeignKey("image.id"))
 
     def __repr__(self):
@@ -226,7 +375,7 @@ class Demo(db.Model):
 class Image(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.Text, index=True, unique=True)
-    data = db.Column(db.Binary)
+    data = db.deferred(db.Column(db.Binary))
     alt_text = db.Column(db.Text)
     thumbnail_for = db.relationship("Demo", backref="thumbnail", lazy="dynamic")
 
@@ -234,11 +383,242 @@ class Image(db.Model):
         return f"<Image {self.filename}>"
 
 
+class PostView(db.Model):
+    """Views and unique visitors of a post on one day; written by app/counters.py."""
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id", ondelete="CASCADE"),
+                        primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    views = db.Column(db.Integer, default=0)
+    # HyperLogLog registers, and the estimate they give.
+    sketch = db.Column(db.LargeBinary)
+    visitors = db.Column(db.Integer, default=0)
+
+
+class Rollup(db.Model):
+    """How many of *metric* happened on a day or in a month, starting at *start*.
+
+    Kept up to date by the mapper events below, so the dashboard and archive
+    never scan the tables they count; flask rebuild-rollups repairs them.
+    """
+    period = db.Column(db.String(8), primary_key=True)
+    metric = db.Column(db.String(16), primary_key=True)
+    start = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, default=0)
+
+    PERIODS = ("day", "month")
+    METRICS = ("posts", "comments", "registrations", "activations", "moderations")
+
+    @staticmethod
+    def period_start(period, day):
+        return day.replace(day=1) if period == "month" else day
+
+
+class Invalidation(db.Model):
+    """Cache invalidations for other workers to read; see app/invalidation.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16))
+    object_id = db.Column(db.Integer)
+    published = db.Column(db.Float, index=True)
+
+
 @login.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    from .queries import user_by_id
+    return user_by_id(int(id))
 
 
 login.anonymous_user = AnonymousUser
 
 db.event.listen(Comment.body, "set", Comment.on_change_body)
+db.event.listen(User.email, "set", User.on_change_profile)
+db.event.listen(User.username, "set", User.on_change_profile)
+
+
+def invalidate_post_page(mapper, connection, target):
+    page_cache.delete(("post", target.id))
+    queue_invalidation(db.object_session(target), "post", target.id)
+
+
+def invalidate_comment_post_page(mapper, connection, target):
+    page_cache.delete(("post", target.post_id))
+    queue_invalidation(db.object_session(target), "post", target.post_id)
+
+
+def invalidate_user(mapper, connection, target):
+    # Most user updates only touch last_seen, which no cache shows.
+    if db.inspect(target).attrs.profile_version.history.has_changes():
+        queue_invalidation(db.object_session(target), "user", target.id)
+
+
+def invalidate_deleted_user(mapper, connection, target):
+    queue_invalidation(db.object_session(target), "user", target.id)
+
+
+def invalidate_role(mapper, connection, target):
+    forget_roles(target.id)
+    queue_invalidation(db.object_session(target), "role", target.id)
+
+
+def invalidate_updated_role(mapper, connection, target):
+    # Giving a new user a role marks the role dirty without changing a column.
+    if db.object_session(target).is_modified(target, include_collections=False):
+        invalidate_role(mapper, connection, target)
+
+
+for event in ("after_insert", "after_update", "after_delete"):
+    db.event.listen(Post, event, invalidate_post_page)
+    db.event.listen(Comment, event, invalidate_comment_post_page)
+db.event.listen(Role, "after_insert", invalidate_role)
+db.event.listen(Role, "after_update", invalidate_updated_role)
+db.event.listen(Role, "after_delete", invalidate_role)
+db.event.listen(User, "after_update", invalidate_user)
+db.event.listen(User, "after_delete", invalidate_deleted_user)
+
+
+def evict_post_page(id):
+    page_cache.delete(("post", id))
+
+
+def evict_user_pages(id):
+    # Post pages show their author's and commenters' names and avatars.
+    if db.session.query(User.id).filter_by(id=id).first() is None:
+        # Deleted users' posts and comments may have gone with them.
+        page_cache.clear()
+        return
+    posts = db.session.query(Post.id).filter_by(author_id=id).union(
+        db.session.query(Comment.post_id).filter_by(author_id=id))
+    for post_id, in posts:
+        page_cache.delete(("post", post_id))
+
+
+def evict_all_pages(id):
+    page_cache.clear()
+
+
+def forget_roles(id):
+    if has_app_context():
+        current_app.extensions.pop("roles", None)
+
+
+bus.subscribe("post", evict_post_page)
+bus.subscribe("user", evict_user_pages)
+bus.subscribe("role", forget_roles)
+bus.subscribe(RESET, evict_all_pages)
+bus.subscribe(RESET, forget_roles)
+
+
+def update_author_stats(connection, author_id, column, delta, timestamp=None):
+    if author_id is None:
+        return
+    users = User.__table__
+    values = {column: users.c[column] + delta}
+    if timestamp is not None:
+        newer = db.or_(users.c.last_activity.is_(None), users.c.last_activity < timestamp)
+        values["last_activity"] = db.case([(newer, timestamp)], else_=users.c.last_activity)
+    connection.execute(users.update().where(users.c.id == author_id).values(**values))
+
+
+def count_post(mapper, connection, target):
+    update_author_stats(connection, target.author_id, "post_count", 1, target.timestamp)
+
+
+def uncount_post(mapper, connection, target):
+    update_author_stats(connection, target.author_id, "post_count", -1)
+
+
+def count_comment(mapper, connection, target):
+    update_author_stats(connection, target.author_id, "comment_count", 1, target.timestamp)
+
+
+def uncount_comment(mapper, connection, target):
+    update_author_stats(connection, target.author_id, "comment_count", -1)
+
+
+def increment_rollups(connection, metric, when, delta=1):
+    if when is None or not delta:
+        return
+    rollups = Rollup.__table__
+    day = when.date() if isinstance(when, datetime) else when
+    for period in Rollup.PERIODS:
+        where = db.and_(rollups.c.period == period, rollups.c.metric == metric,
+                        rollups.c.start == Rollup.period_start(period, day))
+        update = rollups.update().where(where).values(count=rollups.c.count + delta)
+        if connection.execute(update).rowcount:
+            continue
+        try:
+            with connection.begin_nested():
+                connection.execute(rollups.insert().values(
+                    period=period, metric=metric, start=Rollup.period_start(period, day),
+                    count=delta))
+        except IntegrityError:
+            # Another transaction created the row first.
+            connection.execute(update)
+
+
+def roll_up_post(mapper, connection, target):
+    increment_rollups(connection, "posts", target.timestamp)
+
+
+def roll_down_post(mapper, connection, target):
+    increment_rollups(connection, "posts", target.timestamp, -1)
+
+
+def roll_up_comment(mapper, connection, target):
+    increment_rollups(connection, "comments", target.timestamp)
+
+
+def roll_down_comment(mapper, connection, target):
+    increment_rollups(connection, "comments", target.timestamp, -1)
+
+
+def roll_up_moderation(mapper, connection, target):
+    state = db.inspect(target).attrs
+    if state.disabled.history.has_changes() or state.reviewed.history.added == [True]:
+        increment_rollups(connection, "moderations", datetime.utcnow())
+
+
+def roll_up_user(mapper, connection, target):
+    increment_rollups(connection, "registrations", target.member_since)
+
+
+def roll_down_user(mapper, connection, target):
+    increment_rollups(connection, "registrations", target.member_since, -1)
+
+
+def roll_up_activation(mapper, connection, target):
+    if db.inspect(target).attrs.active.history.added == [True]:
+        increment_rollups(connection, "activations", datetime.utcnow())
+
+
+db.event.listen(Post, "after_insert", count_post)
+db.event.listen(Post, "after_delete", uncount_post)
+db.event.listen(Comment, "after_insert", count_comment)
+db.event.listen(Comment, "after_delete", uncount_comment)
+db.event.listen(Post, "after_insert", roll_up_post)
+db.event.listen(Post, "after_delete", roll_down_post)
+db.event.listen(Comment, "after_insert", roll_up_comment)
+db.event.listen(Comment, "after_delete", roll_down_comment)
+db.event.listen(Comment, "after_update", roll_up_moderation)
+db.event.listen(User, "after_insert", roll_up_user)
+db.event.listen(User, "after_delete", roll_down_user)
+db.event.listen(User, "after_update", roll_up_activation)
+
+
+def set_comment_path(mapper, connection, target):
+    comments = Comment.__table__
+    parent_path, parent_depth = "", -1
+    if target.parent_id is not None:
+        parent_path, parent_depth = connection.execute(
+            db.select([comments.c.path, comments.c.depth])
+              .where(comments.c.id == target.parent_id)).first()
+        if parent_path is None:
+            # The parent predates paths; flask backfill-comment-paths fills both in.
+            return
+    path, depth = parent_path + Comment.path_segment(target.id), parent_depth + 1
+    connection.execute(comments.update().where(comments.c.id == target.id)
+                                        .values(path=path, depth=depth))
+    set_committed_value(target, "path", path)
+    set_committed_value(target, "depth", depth)
+
+
+db.event.listen(Comment, "after_insert", set_comment_path)
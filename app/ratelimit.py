@@ -0,0 +1,128 @@
+import fcntl
+import hashlib
+import os
+import threading
+import time
+from importlib import import_module
+
+from .metrics import metrics
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_limit(limit):
+    """Parse a limit such as ``"10/minute"`` into ``(count, seconds)``."""
+    count, _, period = limit.partition("/")
+    return int(count), PERIODS[period.strip().rstrip("s")]
+
+
+def take_token(tokens, updated, now, count, period):
+    # Token bucket: holds up to *count* tokens and refills at count/period per
+    # second. Returns the new state and how long to wait if no token was left.
+    rate = count / period
+    tokens = min(count, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryBackend():
+    """Token buckets kept in this process; each worker enforces its own limits."""
+
+    def __init__(self, app, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, count, period):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (count, now, period))
+            tokens, retry_after = take_token(tokens, updated, now, count, period)
+            self._buckets[key] = (tokens, now, period)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return retry_after
+
+    def _prune(self, now):
+        # A bucket is only full again once its own period has passed.
+        for key, (_, updated, period) in list(self._buckets.items()):
+            if now - updated > period:
+                del self._buckets[key]
+
+
+class FileBackend():
+    """Token buckets in a directory shared by every worker on the machine.
+
+    Each bucket is a small file updated under an exclusive lock. Once an hour
+    each worker removes the buckets that have refilled, as they hold nothing a
+    new bucket would not.
+    """
+
+    prune_interval = 3600
+
+    def __init__(self, app):
+        self.directory = app.config["RATELIMIT_DIRECTORY"]
+        os.makedirs(self.directory, exist_ok=True)
+        self._next_prune = time.monotonic() + self.prune_interval
+
+    def hit(self, key, count, period):
+        if time.monotonic() >= self._next_prune:
+            self._next_prune = time.monotonic() + self.prune_interval
+            self.prune()
+        filename = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        with open(os.path.join(self.directory, filename), "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            now = time.time()
+            try:
+                tokens, updated, _ = (float(v) for v in f.read().split())
+            except ValueError:
+                tokens, updated = count, now
+            tokens, retry_after = take_token(tokens, updated, now, count, period)
+            f.seek(0)
+            f.truncate()
+            f.write(f"{tokens} {now} {period}")
+        return retry_after
+
+    def prune(self):
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                f = open(path, "r+")
+            except FileNotFoundError:
+                continue
+            with f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                try:
+                    _, updated, period = (float(v) for v in f.read().split())
+                except ValueError:
+                    updated, period = os.fstat(f.fileno()).st_mtime, 0
+                if now - updated > period:
+                    os.unlink(path)
+
+
+BACKENDS = {"memory": MemoryBackend, "file": FileBackend}
+
+
+class RateLimiter():
+    def init_app(self, app):
+        backend = app.config["RATELIMIT_BACKEND"]
+        if backend in BACKENDS:
+            backend_class = BACKENDS[backend]
+        else:
+            module, _, name = backend.partition(":")
+            backend_class = getattr(import_module(module), name)
+        app.extensions["ratelimit"] = backend_class(app)
+
+    @staticmethod
+    def hit(app, key, limit):
+        """Take one token for *key*; returns 0 if allowed, else seconds to wait."""
+        retry_after = app.extensions["ratelimit"].hit(key, *parse_limit(limit))
+        if retry_after:
+            metrics.incr("ratelimit.rejected")
+        return retry_after
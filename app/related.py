@@ -0,0 +1,155 @@
+import hashlib
+import re
+from collections import Counter
+
+from . import db, page_cache
+from .invalidation import queue_invalidation
+from .models import Post, RelatedPost
+
+TAG = re.compile(r"<[^>]+>")
+WORD = re.compile(r"[a-z0-9]{3,}")
+STOP_WORDS = frozenset("""
+    a about after all also an and any are as at be because been but by can could do does
+    for from had has have he her his how i if in into is it its just more most my no not
+    of on one only or other our out she so some than that the their them then there these
+    they this to up was we were what when which who will with would you your
+""".split())
+
+
+def digest(title, body):
+    return hashlib.sha1(f"{title}\n{body}".encode("utf-8")).hexdigest()
+
+
+def term_counts(text):
+    counts = Counter(WORD.findall(TAG.sub(" ", text).lower()))
+    for word in STOP_WORDS.intersection(counts):
+        del counts[word]
+    return counts
+
+
+def tfidf(texts, max_terms=64):
+    """Return the L2-normalised TF-IDF matrix of *texts*, one row per text.
+
+    Only the *max_terms* highest-weighted terms of each text are kept, and
+    terms found in a single text are dropped since they cannot make two texts
+    similar. This keeps the matrix sparse enough for fast similarity products.
+    """
+    import numpy as np
+    from scipy import sparse
+    vocabulary = {}
+    indices, data, indptr = [], [], [0]
+    for text in texts:
+        counts = term_counts(text)
+        indices.extend([vocabulary.setdefault(word, len(vocabulary)) for word in counts])
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    data = 1 + np.log(np.array(data, dtype=np.float32))
+    matrix = sparse.csr_matrix((data, indices, indptr),
+                               shape=(len(texts), max(len(vocabulary), 1)))
+    document_frequency = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+    idf[document_frequency < 2] = 0
+    matrix = matrix @ sparse.diags(idf.astype(np.float32))
+    matrix.eliminate_zeros()
+    for row in range(matrix.shape[0]):
+        weights = matrix.data[matrix.indptr[row]:matrix.indptr[row + 1]]
+        if len(weights) > max_terms:
+            weights[np.argpartition(weights, -max_terms)[:-max_terms]] = 0
+    matrix.eliminate_zeros()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return (sparse.diags(1 / norms) @ matrix).tocsr()
+
+
+def top_neighbours(matrix, rows, k, batch_size=256):
+    """Yield ``(row, [(neighbour, score), ...])`` for each of *rows*, best first.
+
+    Similarities are computed *batch_size* rows at a time so memory stays at
+    batch_size x len(matrix) floats.
+    """
+    import numpy as np
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        scores = (matrix[batch] @ transposed).toarray()
+        scores[np.arange(len(batch)), batch] = 0
+        count = min(k, scores.shape[1] - 1)
+        if count <= 0:
+            for row in batch:
+                yield row, []
+            continue
+        best = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best = np.take_along_axis(best, order, axis=1).tolist()
+        best_scores = np.take_along_axis(best_scores, order, axis=1).tolist()
+        for row, neighbours, neighbour_scores in zip(batch, best, best_scores):
+            yield row, [(j, score) for j, score in zip(neighbours, neighbour_scores)
+                        if score > 0]
+
+
+def update_related_posts(k=5, full=False, batch_size=256):
+    """Recompute the related posts of every post that may have new neighbours.
+
+    That is every post whose title or body changed since the last run, every
+    post that lists a changed or deleted post, and every post a changed post is
+    now more similar to than its current k-th neighbour. With *full*, every
+    post is recomputed. Returns the number of posts updated.
+    """
+    import numpy as np
+    posts = db.session.query(Post.id, Post.title, Post.body, Post.related_digest)\
+                      .order_by(Post.id).all()
+    if not posts:
+        return 0
+    ids = [p.id for p in posts]
+    position = {id: i for i, id in enumerate(ids)}
+    digests = [digest(p.title or "", p.body or "") for p in posts]
+    changed = [i for i, p in enumerate(posts) if full or p.related_digest != digests[i]]
+    current = {}
+    for post_id, related_id, score in db.session.query(
+            RelatedPost.post_id, RelatedPost.related_id, RelatedPost.score):
+        current.setdefault(post_id, []).append((related_id, score))
+    orphans = [post_id for post_id in current if post_id not in position]
+    if not changed and not orphans and all(r in position for rows in current.values()
+                                           for r, _ in rows):
+        return 0
+
+    matrix = tfidf([f"{p.title or ''} {p.body or ''}" for p in posts])
+    stale = set(changed)
+    changed_ids = {ids[i] for i in changed}
+    for post_id, neighbours in current.items():
+        if post_id in position and any(r in changed_ids or r not in position
+                                       for r, _ in neighbours):
+            stale.add(position[post_id])
+    if changed and not full:
+        threshold = np.zeros(len(ids), dtype=np.float32)
+        for post_id, neighbours in current.items():
+            if post_id in position and len(neighbours) >= k:
+                threshold[position[post_id]] = min(score for _, score in neighbours)
+        for start in range(0, len(changed), batch_size):
+            similarity = (matrix[changed[start:start + batch_size]] @ matrix.T).toarray()
+            stale.update(np.nonzero((similarity > threshold).any(axis=0))[0].tolist())
+
+    rows = sorted(stale)
+    table = RelatedPost.__table__
+    removed = [ids[i] for i in rows] + orphans
+    for start in range(0, len(removed), 500):
+        db.session.execute(table.delete().where(
+            table.c.post_id.in_(removed[start:start + 500])))
+    values = [{"post_id": ids[row], "rank": rank, "related_id": ids[j], "score": score}
+              for row, neighbours in top_neighbours(matrix, rows, k, batch_size)
+              for rank, (j, score) in enumerate(neighbours)]
+    if values:
+        db.session.execute(table.insert(), values)
+    for post_id in removed:
+        page_cache.delete(("post", post_id))
+        queue_invalidation(db.session(), "post", post_id)
+    if changed:
+        # A core update so that this is not taken for an edit of the posts.
+        posts_table = Post.__table__
+        db.session.execute(posts_table.update()
+                                      .where(posts_table.c.id == db.bindparam("post_id"))
+                                      .values(related_digest=db.bindparam("new_digest")),
+                           [{"post_id": ids[i], "new_digest": digests[i]} for i in changed])
+    db.session.commit()
+    return len(rows)
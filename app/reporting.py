@@ -0,0 +1,205 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import current_app, g, request
+from flask_login import current_user
+
+from .counters import client_address
+
+
+def fingerprint(record):
+    """Group records by exception type and traceback, or else by where they were logged."""
+    if record.exc_info and record.exc_info[0] is not None:
+        exc_type, _, tb = record.exc_info
+        frames = [(frame.filename, frame.name, frame.lineno)
+                  for frame in traceback.extract_tb(tb)]
+        key = repr((exc_type.__module__, exc_type.__qualname__, frames))
+    else:
+        key = repr((record.name, record.pathname, record.lineno))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+class FingerprintingQueueHandler(QueueHandler):
+    """Hands records to the listener thread, which needs no app or request.
+
+    prepare() flattens the traceback into the message, so the fingerprint and
+    exception type are taken first, in the logging thread.
+    """
+
+    def prepare(self, record):
+        record.fingerprint = fingerprint(record)
+        if record.exc_info and record.exc_info[0] is not None:
+            record.exc_type = record.exc_info[0].__qualname__
+        return super().prepare(record)
+
+    def enqueue(self, record):
+        # A full queue means the listener is behind; dropping beats blocking requests.
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+class DigestHandler(logging.Handler):
+    """Groups errors by fingerprint and passes them on to *target* as one digest.
+
+    The first error is sent at once; later ones wait until *interval* seconds
+    after the last digest, so an outage sends one email per interval however
+    many requests fail.
+    """
+
+    def __init__(self, target, interval=300, max_groups=20):
+        super().__init__(logging.ERROR)
+        self.target = target
+        self.interval = interval
+        self.max_groups = max_groups
+        self.groups = OrderedDict()
+        self.next_send = 0
+        self.timer = None
+
+    def emit(self, record):
+        key = getattr(record, "fingerprint", None) or fingerprint(record)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {"record": record, "count": 0}
+        group["count"] += 1
+        group["last"] = record.created
+        now = time.monotonic()
+        if now >= self.next_send:
+            self.flush()
+        elif self.timer is None:
+            self.timer = threading.Timer(self.next_send - now, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def digest(self):
+        groups = sorted(self.groups.values(), key=lambda group: -group["count"])
+        total = sum(group["count"] for group in groups)
+        lines = [f"{total} errors in {len(groups)} groups."]
+        for group in groups[:self.max_groups]:
+            record = group["record"]
+            first = datetime.utcfromtimestamp(record.created).isoformat(" ", "seconds")
+            last = datetime.utcfromtimestamp(group["last"]).isoformat(" ", "seconds")
+            lines.append(f"\n{group['count']} x {getattr(record, 'exc_type', record.levelname)}"
+                         f" ({getattr(record, 'fingerprint', '-')}), first at {first} UTC,"
+                         f" last at {last} UTC:\n{record.getMessage()}")
+        if len(groups) > self.max_groups:
+            lines.append(f"\n{len(groups) - self.max_groups} more groups not shown.")
+        return logging.makeLogRecord({"name": "digest", "levelno": logging.ERROR,
+                                      "levelname": "ERROR", "msg": "\n".join(lines)})
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.groups:
+                self.target.handle(self.digest())
+                self.groups.clear()
+                self.next_send = time.monotonic() + self.interval
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        self.target.close()
+        super().close()
+
+
+class JsonFormatter(logging.Formatter):
+    FIELDS = ("fingerprint", "exc_type", "method", "path", "status", "duration", "address",
+              "user")
+
+    def format(self, record):
+        entry = {
+            "time": datetime.utcfromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        entry.update((field, getattr(record, field)) for field in self.FIELDS
+                     if hasattr(record, field))
+        return json.dumps(entry)
+
+
+def file_handler(app, filename, record_filter):
+    handler = RotatingFileHandler(os.path.join(app.config["LOG_DIRECTORY"], filename),
+                                  maxBytes=app.config["LOG_FILE_MAX_BYTES"],
+                                  backupCount=app.config["LOG_FILE_BACKUPS"])
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(record_filter)
+    return handler
+
+
+def init_logging(app, mail_handler=None):
+    """Move the app's error reporting, and access logging, off the request thread.
+
+    Records go through a queue to a listener thread that sends *mail_handler*
+    digests of errors and, with LOG_DIRECTORY set, writes JSON lines to
+    rotating error.log and access.log files there.
+    """
+    access_logger = logging.getLogger(f"{app.name}.access")
+    handlers = []
+    if mail_handler is not None:
+        handlers.append(DigestHandler(mail_handler, app.config["ERROR_DIGEST_INTERVAL"],
+                                      app.config["ERROR_DIGEST_MAX_GROUPS"]))
+    if app.config["LOG_DIRECTORY"]:
+        os.makedirs(app.config["LOG_DIRECTORY"], exist_ok=True)
+        error_log = file_handler(app, "error.log", lambda r: r.name != access_logger.name)
+        error_log.setLevel(logging.WARNING)
+        handlers.append(error_log)
+        handlers.append(file_handler(app, "access.log",
+                                     lambda r: r.name == access_logger.name))
+        access_logger.setLevel(logging.INFO)
+        app.before_request(start_timer)
+        app.after_request(log_access)
+    if not handlers:
+        return None
+
+    records = queue.Queue(app.config["LOG_QUEUE_SIZE"])
+    queue_handler = FingerprintingQueueHandler(records)
+    app.logger.addHandler(queue_handler)
+    # Access lines only go to their file, not to the app's other handlers.
+    access_logger.propagate = False
+    access_logger.addHandler(queue_handler)
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_listener, listener)
+    app.extensions["log_listener"] = listener
+    return listener
+
+
+def stop_listener(listener):
+    """Send what is queued and close the handlers; later calls do nothing."""
+    if getattr(listener, "stopped", False):
+        return
+    listener.stopped = True
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+def log_access(response):
+    duration = time.perf_counter() - g.get("request_start", time.perf_counter())
+    logging.getLogger(f"{current_app.name}.access").info(
+        "%s %s %s", request.method, request.full_path.rstrip("?"), response.status_code,
+        extra={"method": request.method, "path": request.path, "status": response.status_code,
+               "duration": round(duration, 4),
+               "address": client_address(),
+               "user": current_user.get_id() if current_user.is_authenticated else None})
+    return response
@@ -0,0 +1,67 @@
+from collections import Counter
+from datetime import timedelta
+
+from . import db
+from .models import Comment, Post, Rollup, User
+
+# The metrics whose events can be recounted from the tables themselves.
+SOURCES = {
+    "posts": Post.timestamp,
+    "comments": Comment.timestamp,
+    "registrations": User.member_since
+}
+
+
+def rebuild_rollups(batch_size=1000):
+    """Recount the posts, comments and registrations rollups from their tables.
+
+    Activations and moderation actions are only recorded in the rollups, so
+    they are left as they are. Returns the number of rows written.
+    """
+    rollups = Rollup.__table__
+    written = 0
+    for metric, column in SOURCES.items():
+        counts = Counter()
+        for when, in db.session.query(column).filter(column.isnot(None)).yield_per(batch_size):
+            for period in Rollup.PERIODS:
+                counts[(period, Rollup.period_start(period, when.date()))] += 1
+        db.session.execute(rollups.delete().where(rollups.c.metric == metric))
+        if counts:
+            db.session.execute(rollups.insert(), [
+                {"period": period, "metric": metric, "start": start, "count": count}
+                for (period, start), count in counts.items()])
+        written += len(counts)
+    db.session.commit()
+    return written
+
+
+def month_starts(last, count):
+    """The first days of the *count* months up to and including *last*'s, oldest first."""
+    months = [last.replace(day=1)]
+    while len(months) < count:
+        months.append((months[-1] - timedelta(days=1)).replace(day=1))
+    return months[::-1]
+
+
+def series(period, starts, metrics=Rollup.METRICS):
+    """Map each of *metrics* to its counts for each of *starts*, zero where nothing happened."""
+    rows = db.session.query(Rollup.metric, Rollup.start, Rollup.count).filter(
+        Rollup.period == period, Rollup.metric.in_(metrics),
+        Rollup.start.between(starts[0], starts[-1]))
+    counts = {(metric, start): count for metric, start, count in rows}
+    return {metric: [counts.get((metric, start), 0) for start in starts] for metric in metrics}
+
+
+def totals():
+    rows = db.session.query(Rollup.metric, db.func.sum(Rollup.count))\
+                     .filter(Rollup.period == "month").group_by(Rollup.metric)
+    counts = dict(rows)
+    return {metric: counts.get(metric) or 0 for metric in Rollup.METRICS}
+
+
+def archive_months():
+    """``(month start, post count)`` of every month with posts, newest first."""
+    return db.session.query(Rollup.start, Rollup.count)\
+                     .filter(Rollup.period == "month", Rollup.metric == "posts",
+                             Rollup.count > 0)\
+                     .order_by(Rollup.start.desc()).all()
@@ -0,0 +1,175 @@
+import hashlib
+import hmac
+import re
+import threading
+import time
+
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie
+from werkzeug.wrappers import Response
+
+from .counters import INTERNAL_REQUEST
+from .metrics import metrics
+
+LOW, NORMAL, HIGH = "low", "normal", "high"
+
+
+class ConcurrencyLimit():
+    """An AIMD limit on the requests a worker handles at once.
+
+    Every request that finishes within the target latency while the limit was
+    at least half used raises the limit by 1/limit, so about one per limit's
+    worth of requests; a slower one cuts it by *backoff*, at most once per
+    target latency so that a burst of slow requests counts as one signal.
+    Low-priority requests may only use *low_share* of the limit, so they are
+    shed first; high-priority ones are always admitted.
+    """
+
+    def __init__(self, initial=20, minimum=2, maximum=200, target_latency=0.5, backoff=0.75,
+                 low_share=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.low_share = low_share
+        self.inflight = 0
+        self._next_decrease = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, priority):
+        """Admit a request; returns the number in flight before it, or None if shed."""
+        with self._lock:
+            share = self.low_share if priority == LOW else 1
+            if priority != HIGH and self.inflight >= max(self.limit * share, 1):
+                return None
+            self.inflight += 1
+            return self.inflight - 1
+
+    def release(self, latency, inflight):
+        with self._lock:
+            self.inflight -= 1
+            now = time.monotonic()
+            if latency > self.target_latency:
+                if now >= self._next_decrease:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._next_decrease = now + self.target_latency
+            elif inflight + 1 >= self.limit / 2:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+
+class ReleasingIterator():
+    """Calls *callback* once the response is exhausted or closed, whichever is first."""
+
+    def __init__(self, iterable, callback):
+        self._iterator = iter(iterable)
+        self._close = getattr(iterable, "close", None)
+        self._callback = callback
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            self._release()
+            raise
+
+    def close(self):
+        try:
+            if self._close is not None:
+                self._close()
+        finally:
+            self._release()
+
+    def _release(self):
+        callback, self._callback = self._callback, None
+        if callback is not None:
+            callback()
+
+
+class LoadShedder():
+    """WSGI middleware that answers 503 straight away once the limit is reached.
+
+    Requests are classed from the environ alone, before Flask does any work:
+    writes by signed-in users are high priority, anonymous GETs to
+    LOAD_SHED_LOW_PRIORITY paths are low, and the rest normal. Signed in means
+    a session cookie holding a user id or a remember cookie, both checked
+    against the secret key. Latency is measured until the response is fully sent,
+    so streamed pages count in full.
+    """
+
+    def init_app(self, app):
+        config = app.config
+        if not config["LOAD_SHED_ENABLED"]:
+            return
+        self.limit = ConcurrencyLimit(config["LOAD_SHED_INITIAL_LIMIT"],
+                                      config["LOAD_SHED_MIN_LIMIT"],
+                                      config["LOAD_SHED_MAX_LIMIT"],
+                                      config["LOAD_SHED_TARGET_LATENCY"],
+                                      low_share=config["LOAD_SHED_LOW_SHARE"])
+        self.low_priority = re.compile(config["LOAD_SHED_LOW_PRIORITY"])
+        self.session_cookie = config["SESSION_COOKIE_NAME"]
+        self.remember_cookie = config.get("REMEMBER_COOKIE_NAME", "remember_token")
+        self.serializer = app.session_interface.get_signing_serializer(app)
+        self.max_age = int(app.permanent_session_lifetime.total_seconds())
+        secret_key = app.secret_key or b""
+        self.secret_key = secret_key.encode("latin1") if isinstance(secret_key, str) else secret_key
+        self.retry_after = config["LOAD_SHED_RETRY_AFTER"]
+        app.extensions["load_shedder"] = self.limit
+        app.wsgi_app = self.wrap(app.wsgi_app)
+
+    def signed_in(self, environ):
+        cookies = parse_cookie(environ)
+        session = cookies.get(self.session_cookie)
+        if session and self.serializer is not None:
+            try:
+                if "_user_id" in self.serializer.loads(session, max_age=self.max_age):
+                    return True
+            except BadSignature:
+                pass
+        # Flask-Login signs the user id in the remember cookie as "id|hmac".
+        payload, _, digest = cookies.get(self.remember_cookie, "").rpartition("|")
+        if not (payload and self.secret_key):
+            return False
+        expected = hmac.new(self.secret_key, payload.encode("utf-8"), hashlib.sha512).hexdigest()
+        return hmac.compare_digest(digest, expected)
+
+    def priority(self, environ):
+        signed_in = self.signed_in(environ)
+        if environ["REQUEST_METHOD"] not in ("GET", "HEAD"):
+            return HIGH if signed_in else NORMAL
+        if not signed_in and self.low_priority.match(environ.get("PATH_INFO", "")):
+            return LOW
+        return NORMAL
+
+    def wrap(self, wsgi_app):
+        limit = self.limit
+
+        def shedding_app(environ, start_response):
+            if environ.get(INTERNAL_REQUEST):
+                return wsgi_app(environ, start_response)
+            priority = self.priority(environ)
+            inflight = limit.acquire(priority)
+            metrics.set("shedding.limit", round(limit.limit, 2))
+            metrics.set("shedding.inflight", limit.inflight)
+            if inflight is None:
+                metrics.incr(f"shedding.rejected.{priority}")
+                response = Response("The server is busy, please try again shortly.", 503,
+                                    {"Retry-After": str(self.retry_after)})
+                return response(environ, start_response)
+            start = time.perf_counter()
+
+            def finished():
+                latency = time.perf_counter() - start
+                limit.release(latency, inflight)
+                metrics.observe("shedding.latency", latency)
+
+            try:
+                return ReleasingIterator(wsgi_app(environ, start_response), finished)
+            except BaseException:
+                finished()
+                raise
+
+        return shedding_app
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+basedir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+WORKER_ENTRYPOINT = os.path.join(basedir, "kyle-site.py")
+
+# Modules a plain web worker should never import; they are only needed by CLI
+# commands, development helpers or the first write of a particular kind.
+LAZY_MODULES = ("alembic", "bleach", "coverage", "faker", "flask_mail", "flask_migrate", "numpy",
+                "scipy")
+
+
+def worker_import_code(entrypoint=WORKER_ENTRYPOINT):
+    return f"import runpy; runpy.run_path({entrypoint!r}, run_name='kyle_site')"
+
+
+def import_times(code, env=None):
+    """Import *code* in a fresh interpreter under ``-X importtime``.
+
+    Returns a list of ``(module, self_us, cumulative_us, depth)`` tuples in the
+    order the interpreter reported them.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=basedir,
+                            env=env,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Import failed:\n{result.stderr[-2000:]}")
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return times
+
+
+def total_import_time(times):
+    return sum(cumulative for _, _, cumulative, depth in times if depth == 0) / 1e6
+
+
+def loaded_lazy_modules(times):
+    loaded = {name.split(".")[0] for name, _, _, _ in times}
+    return sorted(loaded.intersection(LAZY_MODULES))
+
+
+def startup_report(times, length=25):
+    lines = [f"Total import time: {total_import_time(times):.3f}s", ""]
+    lines.append(f"{'cumulative':>12} {'self':>10}  module")
+    top = sorted(times, key=lambda t: t[2], reverse=True)[:length]
+    for name, self_us, cumulative_us, depth in top:
+        lines.append(f"{cumulative_us / 1000:10.1f}ms {self_us / 1000:8.1f}ms  "
+                     f"{'  ' * depth}{name}")
+    lazy = loaded_lazy_modules(times)
+    if lazy:
+        lines.append("")
+        lines.append("Modules that should load lazily: " + ", ".join(lazy))
+    return "\n".join(lines)
@@ -0,0 +1,17 @@
+"use strict";
+
+document.addEventListener("click", evt => {
+    const link = evt.target.closest("a.load-more");
+    if (!link) {
+        return;
+    }
+    evt.preventDefault();
+    fetch(link.href, {credentials: "same-origin"})
+        .then(response => response.text())
+        .then(html => {
+            const more = link.closest("li.more");
+            more.insertAdjacentHTML("beforebegin", html);
+            more.remove();
+            render_all_timestamps();
+        });
+});
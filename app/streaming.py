@@ -0,0 +1,54 @@
+from flask import Response, current_app, g, get_flashed_messages, stream_with_context
+
+from . import db
+from .indexes import log_queries
+from .metrics import metrics
+
+STREAM_ERROR = '<p class="stream-error">Sorry, the rest of this page could not be loaded.</p>'
+
+
+def chunked(pieces, size):
+    # Jinja yields many tiny strings; group them so each write to the client
+    # carries at least *size* characters.
+    buffer, length = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def guarded(chunks):
+    # The status line has already gone out, so a failure can only be logged and
+    # reported inside the page.
+    try:
+        yield from chunks
+    except Exception:
+        current_app.logger.exception("Error while streaming a response")
+        metrics.incr("stream.errors")
+        db.session.rollback()
+        yield STREAM_ERROR
+    finally:
+        log_queries()
+
+
+def stream_template(template_name, **context):
+    """Render a template as a streamed response.
+
+    The page goes out in STREAM_CHUNK_SIZE pieces as it renders, so the head
+    and post body reach the client before the comments are rendered. The
+    request context, and with it the database session, stays open until the
+    last chunk has been sent, but the session cookie is saved before the
+    first, so flashed messages are taken out of the session here rather than
+    by the template. Queries are logged once the page has been sent.
+    """
+    get_flashed_messages()
+    g.streaming = True
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    template = app.jinja_env.get_or_select_template(template_name)
+    chunks = chunked(template.generate(context), app.config["STREAM_CHUNK_SIZE"])
+    return Response(stream_with_context(guarded(chunks)))
@@ -0,0 +1,122 @@
+from datetime import datetime
+
+from flask import current_app
+
+from . import db
+from .models import Comment
+
+
+# Every comment is rendered with its author, so they are loaded in the same query.
+with_author = db.joinedload("author")
+
+
+class ThreadNode():
+    """A comment with the replies loaded so far and a cursor to the rest."""
+
+    def __init__(self, comment):
+        self.comment = comment
+        self.replies = []
+        self.has_more = False
+        self.cursor = None
+
+
+def encode_cursor(comment):
+    return f"{comment.timestamp.isoformat()}_{comment.id}"
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, _, id = cursor.rpartition("_")
+        return datetime.fromisoformat(timestamp), int(id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def after(query, cursor, descending):
+    # Keyset pagination on (timestamp, id) so deep pages cost the same as the first.
+    position = decode_cursor(cursor)
+    if position is None:
+        return query
+    timestamp, id = position
+    if descending:
+        return query.filter(db.or_(Comment.timestamp < timestamp,
+                                   db.and_(Comment.timestamp == timestamp, Comment.id < id)))
+    return query.filter(db.or_(Comment.timestamp > timestamp,
+                               db.and_(Comment.timestamp == timestamp, Comment.id > id)))
+
+
+def page_of(comments, limit):
+    nodes = [ThreadNode(c) for c in comments[:limit]]
+    cursor = encode_cursor(comments[limit - 1]) if len(comments) > limit else None
+    return nodes, cursor
+
+
+def load_roots(post, cursor=None):
+    """Return a page of the post's top-level comments, newest first, with their
+    first replies expanded, and the cursor to the next page (or None)."""
+    limit = current_app.config["COMMENT_ROOTS_PER_PAGE"]
+    query = after(post.comments.filter_by(parent_id=None), cursor, descending=True)
+    comments = query.options(with_author).order_by(Comment.timestamp.desc(), Comment.id.desc())\
+                    .limit(limit + 1).all()
+    nodes, next_cursor = page_of(comments, limit)
+    expand(nodes)
+    return nodes, next_cursor
+
+
+def load_replies(parent, cursor=None):
+    """Return the next page of replies to *parent*, oldest first, expanded."""
+    limit = current_app.config["COMMENT_REPLIES_PER_PAGE"]
+    query = after(Comment.query.filter_by(parent_id=parent.id), cursor, descending=False)
+    comments = query.options(with_author).order_by(Comment.timestamp, Comment.id)\
+                    .limit(limit + 1).all()
+    nodes, next_cursor = page_of(comments, limit)
+    expand(nodes)
+    return nodes, next_cursor
+
+
+def expand(nodes):
+    """Load the first replies of every node, level by level.
+
+    Each level takes one query, however many parents it has, by numbering the
+    replies of each parent with a window function. Below COMMENT_THREAD_DEPTH
+    levels only whether more replies exist is recorded.
+    """
+    limit = current_app.config["COMMENT_REPLIES_PER_PAGE"]
+    for depth in range(current_app.config["COMMENT_THREAD_DEPTH"] + 1):
+        if not nodes:
+            return
+        by_id = {node.comment.id: node for node in nodes}
+        position = db.func.row_number().over(partition_by=Comment.parent_id,
+                                             order_by=(Comment.timestamp, Comment.id))
+        numbered = db.session.query(Comment.id, position.label("position"))\
+                             .filter(Comment.parent_id.in_(list(by_id))).subquery()
+        level_limit = 1 if depth == current_app.config["COMMENT_THREAD_DEPTH"] else limit + 1
+        replies = Comment.query.join(numbered, numbered.c.id == Comment.id)\
+                               .filter(numbered.c.position <= level_limit)\
+                               .options(with_author)\
+                               .order_by(Comment.timestamp, Comment.id).all()
+        children = {}
+        for reply in replies:
+            children.setdefault(reply.parent_id, []).append(reply)
+        nodes = []
+        for parent_id, comments in children.items():
+            parent = by_id[parent_id]
+            if level_limit == 1:
+                parent.has_more = True
+                continue
+            parent.replies, parent.cursor = page_of(comments, limit)
+            parent.has_more = parent.cursor is not None
+            nodes.extend(parent.replies)
+
+
+def load_subtree(comment, depth=None):
+    """Return *comment* as a ThreadNode with its replies, at most *depth* levels
+    down, built from a single range scan over the materialized paths."""
+    root = ThreadNode(comment)
+    if comment.path is None:
+        return root
+    nodes = {comment.id: root}
+    for reply in comment.subtree(depth).options(with_author):
+        nodes[reply.id] = ThreadNode(reply)
+        nodes[reply.parent_id].replies.append(nodes[reply.id])
+    return root
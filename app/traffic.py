@@ -0,0 +1,203 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qsl
+
+from flask import request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .counters import INTERNAL_REQUEST
+from .shedding import ReleasingIterator
+
+# The environ keys the Flask hooks use to tell the middleware about a request.
+SESSION_KEY = "traffic.session"
+ENDPOINT_KEY = "traffic.endpoint"
+
+
+class TrafficRecorder():
+    """WSGI middleware that appends a sample of requests to TRAFFIC_RECORD_FILE.
+
+    Each line is a JSON object: the start time ``t``, method ``m``, path and
+    query ``p``, endpoint ``e``, session class ``s`` (the visitor's role, or
+    anonymous), status ``c``, duration in milliseconds ``d`` and, for form
+    posts, the field names ``f``. No cookies, addresses or form values are
+    kept, and paths matching TRAFFIC_EXCLUDE (tokens, passwords) are skipped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+
+    def init_app(self, app):
+        if not app.config["TRAFFIC_RECORD_FILE"]:
+            return
+        self.path = app.config["TRAFFIC_RECORD_FILE"]
+        self.sample_rate = app.config["TRAFFIC_SAMPLE_RATE"]
+        self.exclude = re.compile(app.config["TRAFFIC_EXCLUDE"])
+        app.after_request(self.classify)
+        app.wsgi_app = self.wrap(app.wsgi_app)
+
+    @staticmethod
+    def classify(response):
+        role = current_user.is_authenticated and current_user.role
+        request.environ[SESSION_KEY] = role.name if role else "anonymous"
+        request.environ[ENDPOINT_KEY] = request.endpoint
+        return response
+
+    def wrap(self, wsgi_app):
+        def recording_app(environ, start_response):
+            path = environ.get("PATH_INFO", "")
+            if (random.random() >= self.sample_rate or self.exclude.match(path)
+                    or environ.get(INTERNAL_REQUEST)):
+                return wsgi_app(environ, start_response)
+            entry = {"t": round(time.time(), 3), "m": environ["REQUEST_METHOD"], "p": path}
+            if environ.get("QUERY_STRING"):
+                entry["p"] += "?" + environ["QUERY_STRING"]
+            if environ.get("CONTENT_TYPE", "").startswith("application/x-www-form-urlencoded"):
+                # Only the field names are kept; the body is put back for the app.
+                body = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+                environ["wsgi.input"] = BytesIO(body)
+                entry["f"] = sorted({name for name, _ in parse_qsl(body.decode("latin-1"))})
+            status = []
+            start = time.perf_counter()
+
+            def recording_start_response(status_line, headers, exc_info=None):
+                status.append(int(status_line.split(" ", 1)[0]))
+                return start_response(status_line, headers, exc_info)
+
+            def finished():
+                entry["d"] = round((time.perf_counter() - start) * 1000, 1)
+                entry["c"] = status[-1] if status else 500
+                entry["e"] = environ.get(ENDPOINT_KEY)
+                entry["s"] = environ.get(SESSION_KEY, "anonymous")
+                self.write(entry)
+
+            try:
+                return ReleasingIterator(wsgi_app(environ, recording_start_response), finished)
+            except BaseException:
+                finished()
+                raise
+
+        return recording_app
+
+    def write(self, entry):
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", buffering=1)
+            self._file.write(line)
+
+
+_queries = threading.local()
+
+
+def count_query(*args):
+    _queries.count = getattr(_queries, "count", 0) + 1
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+
+def replay(app, path, concurrency=8, speed=1.0, limit=None):
+    """Replay the recorded requests in *path* against *app* from *concurrency* threads.
+
+    Requests start at their recorded offsets divided by *speed*, or as fast
+    as the threads allow with a speed of 0. Each session class is logged in as
+    an active user with that role; posts are sent with every recorded field
+    set to a placeholder. The requests are marked internal, so they are not
+    recorded again, shed or counted as views. Returns a report per endpoint.
+    """
+    from flask import session
+    from flask_login import login_user
+    from .models import Role, User
+    with open(path) as f:
+        entries = sorted((json.loads(line) for line in f if line.strip()),
+                         key=lambda entry: entry["t"])[:limit]
+    if not entries:
+        return {}
+
+    sessions = {}
+    with app.app_context():
+        for role in Role.query.all():
+            user = User.query.filter_by(role=role, active=True).first()
+            if user is not None:
+                with app.test_request_context():
+                    login_user(user)
+                    sessions[role.name] = dict(session)
+    clients = threading.local()
+
+    def client_for(session_class):
+        if not hasattr(clients, "clients"):
+            clients.clients = {}
+        client = clients.clients.get(session_class)
+        if client is None:
+            client = clients.clients[session_class] = app.test_client()
+            if session_class in sessions:
+                with client.session_transaction() as client_session:
+                    client_session.update(sessions[session_class])
+        return client
+
+    results = defaultdict(lambda: {"latencies": [], "errors": 0, "queries": 0, "skipped": 0})
+    results_lock = threading.Lock()
+
+    def send(entry):
+        session_class = entry.get("s", "anonymous")
+        if session_class != "anonymous" and session_class not in sessions:
+            with results_lock:
+                results[entry.get("e") or entry["p"]]["skipped"] += 1
+            return
+        data = {name: "replayed" for name in entry.get("f", ())}
+        _queries.count = 0
+        start = time.perf_counter()
+        try:
+            response = client_for(session_class).open(
+                entry["p"], method=entry["m"], data=data or None, base_url="https://localhost",
+                environ_overrides={INTERNAL_REQUEST: True})
+            response.get_data()
+            failed = response.status_code >= 500
+        except Exception:
+            failed = True
+        latency = time.perf_counter() - start
+        with results_lock:
+            result = results[entry.get("e") or entry["p"]]
+            result["latencies"].append(latency)
+            result["errors"] += failed
+            result["queries"] += _queries.count
+
+    event.listen(Engine, "before_cursor_execute", count_query)
+    try:
+        with ThreadPoolExecutor(concurrency) as pool:
+            begin, first = time.monotonic(), entries[0]["t"]
+            futures = []
+            for entry in entries:
+                if speed:
+                    delay = (entry["t"] - first) / speed - (time.monotonic() - begin)
+                    if delay > 0:
+                        time.sleep(delay)
+                futures.append(pool.submit(send, entry))
+            for future in futures:
+                future.result()
+    finally:
+        event.remove(Engine, "before_cursor_execute", count_query)
+
+    return {
+        endpoint: {
+            "requests": len(result["latencies"]),
+            "p50": percentile(result["latencies"], 50),
+            "p95": percentile(result["latencies"], 95),
+            "p99": percentile(result["latencies"], 99),
+            "errors": result["errors"],
+            "queries": result["queries"],
+            "skipped": result["skipped"]
+        }
+        for endpoint, result in sorted(results.items())
+    }
@@ -0,0 +1,66 @@
+import time
+
+from flask import current_app, url_for
+
+from . import db, page_cache
+from .models import Post, Role
+
+HOT_TEMPLATES = [
+    "base.html.j2", "_macros.html.j2", "index.html.j2", "_popular.html.j2", "blog.html.j2",
+    "_posts.html.j2", "post.html.j2", "_comments.html.j2", "_thread.html.j2",
+    "_comment.html.j2", "404.html.j2"
+]
+
+
+def open_connections(count):
+    connections = [db.engine.connect() for _ in range(count)]
+    for connection in connections:
+        connection.execute("SELECT 1")
+    for connection in connections:
+        connection.close()
+    return len(connections)
+
+
+def load_roles():
+    return len(Role.query.all())
+
+
+def compile_templates():
+    for name in HOT_TEMPLATES:
+        current_app.jinja_env.get_template(name)
+    return len(HOT_TEMPLATES)
+
+
+def preload_posts(count):
+    from .main.views import render_post
+    loaded = 0
+    posts = Post.query.options(db.undefer(Post.body)).order_by(Post.timestamp.desc())
+    for post in posts.limit(count):
+        key = ("post", post.id)
+        if key in page_cache:
+            continue
+        with current_app.test_request_context(url_for("main.post", slug=post.slug)):
+            page_cache.set(key, render_post(post))
+        loaded += 1
+    return loaded
+
+
+def warm_up():
+    """Run every warmup step and return how long each took, in milliseconds.
+
+    Every step is safe to repeat, so App Engine retrying the warmup request
+    does no harm.
+    """
+    config = current_app.config
+    steps = [
+        ("connections", open_connections, config["WARMUP_CONNECTIONS"]),
+        ("roles", load_roles),
+        ("templates", compile_templates),
+        ("posts", preload_posts, config["WARMUP_POSTS"]),
+    ]
+    report = {}
+    for name, step, *args in steps:
+        start = time.perf_counter()
+        count = step(*args)
+        report[name] = {"count": count, "ms": round((time.perf_counter() - start) * 1000, 2)}
+    return report
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -9,6 +10,7 @@ class Config():
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_RECORD_QUERIES = os.environ.get("DB_RECORD_QUERIES")
     DB_SLOW_QUERY_TIME = 0.5
+    DB_QUERY_LOG = os.environ.get("DB_QUERY_LOG")
     MAIL_SERVER = os.environ.get("MAIL_SERVER")
     MAIL_PORT = int(os.environ.get("MAIL_PORT"))
     MAIL_USE_TLS = True
@@ -17,8 +19,99 @@ class Config():
     MAIL_SUBJECT_PREFIX = "[Kyle's junk] "
     MAIL_SENDER = os.environ.get("MAIL_SENDER")
     ADMIN_ADDRESS = os.environ.get("ADMIN_ADDRESS")
+    # App Engine sets X-Appengine-User-Ip and strips it from client requests;
+    # anywhere else a client could send its own.
+    TRUST_APP_ENGINE_HEADERS = os.environ.get("GAE_ENV") == "standard"
     POSTS_PER_PAGE = 10
     COMMENTS_PER_PAGE = 10
+    COMMENT_ROOTS_PER_PAGE = 20
+    COMMENT_REPLIES_PER_PAGE = 5
+    COMMENT_THREAD_DEPTH = 4
+    STARTUP_IMPORT_BUDGET = 1.5
+    SSLIFY_SKIPS = ["_ah/"]
+    PAGE_CACHE_SIZE = 256
+    PAGE_CACHE_TIMEOUT = 60
+    PAGE_CACHE_STALE_TIMEOUT = 300
+    PAGE_CACHE_WAIT_TIMEOUT = 10
+    # Set to share rendered pages, and the work of rendering them, between the
+    # workers on one machine.
+    PAGE_CACHE_DIRECTORY = os.environ.get("PAGE_CACHE_DIRECTORY")
+    PAGE_CACHE_SWEEP_AGE = 3600
+    # Comment fragments are keyed on everything they show, so entries only go
+    # stale by falling out of the LRU.
+    FRAGMENT_CACHE_SIZE = 4096
+    FRAGMENT_CACHE_TIMEOUT = 3600
+    STREAM_TEMPLATES = True
+    STREAM_CHUNK_SIZE = 4096
+    WARMUP_CONNECTIONS = 5
+    WARMUP_POSTS = 10
+    # App Engine sends its own requests, warmup included, from 0.1.0.x.
+    WARMUP_ADDRESS_PREFIX = "0.1.0."
+    DB_REPLICA_URIS = [uri for uri in os.environ.get("DB_REPLICA_URLS", "").split(",") if uri]
+    DB_REPLICA_ENDPOINTS = [
+        "main.blog", "main.post", "main.post_comments", "main.comment_replies", "main.index",
+        "main.demos", "main.image", "main.archive", "main.blog_month"
+    ]
+    DB_STICKY_PRIMARY_SECONDS = 10
+    # Anonymous pages are marked public for shared caches (0 turns this off);
+    # browsers still revalidate so that logging in shows the private version.
+    PUBLIC_CACHE_S_MAXAGE = 60
+    PUBLIC_CACHE_MAX_AGE = 0
+    PUBLIC_CACHE_ENDPOINTS = [
+        "main.index", "main.blog", "main.post", "main.post_comments", "main.comment_replies",
+        "main.demos", "main.image", "main.about_me", "main.archive", "main.blog_month"
+    ]
+    RATELIMIT_ENABLED = True
+    RATELIMIT_BACKEND = os.environ.get("RATELIMIT_BACKEND", "memory")
+    RATELIMIT_DIRECTORY = os.path.join(tempfile.gettempdir(), "kyle-site-ratelimit")
+    RATELIMIT_LOGIN = "10/minute"
+    # Per account, from every address, so guessing one password is limited too.
+    RATELIMIT_LOGIN_USERNAME = "30/hour"
+    RATELIMIT_REGISTER = "5/hour"
+    RATELIMIT_COMMENT = "10/minute"
+    VIEW_FLUSH_SECONDS = 30
+    POPULAR_POSTS = 5
+    POPULAR_WINDOW_DAYS = 14
+    POPULAR_HALF_LIFE_DAYS = 3
+    DASHBOARD_DAYS = 30
+    DASHBOARD_MONTHS = 12
+    # Each worker adapts how many requests it handles at once to keep their
+    # latency under the target, answering 503 to the rest; anonymous GETs of
+    # the low-priority paths are shed first.
+    LOAD_SHED_ENABLED = True
+    LOAD_SHED_INITIAL_LIMIT = 20
+    LOAD_SHED_MIN_LIMIT = 2
+    LOAD_SHED_MAX_LIMIT = 200
+    LOAD_SHED_TARGET_LATENCY = 1.0
+    LOAD_SHED_LOW_SHARE = 0.5
+    LOAD_SHED_LOW_PRIORITY = r"/($|blog(/|$)|demos$|img/)"
+    LOAD_SHED_RETRY_AFTER = 5
+    # Errors are emailed at most once per interval, grouped by traceback; with
+    # LOG_DIRECTORY set, JSON error and access logs are also written there.
+    ERROR_DIGEST_INTERVAL = 300
+    ERROR_DIGEST_MAX_GROUPS = 20
+    LOG_DIRECTORY = os.environ.get("LOG_DIRECTORY")
+    LOG_FILE_MAX_BYTES = 10 << 20
+    LOG_FILE_BACKUPS = 5
+    LOG_QUEUE_SIZE = 10000
+    # tracemalloc slows every allocation down, so only turn this on for one
+    # instance at a time.
+    MEMORY_PROFILE_ENABLED = os.environ.get("MEMORY_PROFILE") == "1"
+    MEMORY_PROFILE_SAMPLE_RATE = 0.01
+    MEMORY_PROFILE_FRAMES = 1
+    MEMORY_PROFILE_TOP = 20
+    MEMORY_PROFILE_DIRECTORY = os.path.join(tempfile.gettempdir(), "kyle-site-memory")
+    # A sample of requests is appended here for flask replay when set.
+    TRAFFIC_RECORD_FILE = os.environ.get("TRAFFIC_RECORD_FILE")
+    TRAFFIC_SAMPLE_RATE = float(os.environ.get("TRAFFIC_SAMPLE_RATE", 0.1))
+    TRAFFIC_EXCLUDE = r"/(auth|admin|shutdown|_ah)(/|$)"
+    INVALIDATION_BACKEND = os.environ.get("INVALIDATION_BACKEND", "local")
+    INVALIDATION_POLL_SECONDS = 1.0
+    INVALIDATION_FILE = os.path.join(tempfile.gettempdir(), "kyle-site-invalidation.log")
+    INVALIDATION_FILE_MAX_SIZE = 1 << 20
+    INVALIDATION_RETENTION = 3600
+    INVALIDATION_LOOKBACK = 30
+    INVALIDATION_CHANNEL = "cache_invalidation"
 
     @staticmethod
     def init_app(app):
@@ -39,20 +132,39 @@ class TestingConfig(Config):
     SSL_REDIRECT = True
 
 
+def cloud_sql_uri(driver):
+    # pg8000 is pure Python; psycopg2 decodes rows in C and is much faster on
+    # large result sets.
+    socket_dir = "/cloudsql/{}".format(os.environ.get("CLOUD_SQL_INSTANCE_NAME"))
+    if driver == "psycopg2":
+        socket_option = f"host={socket_dir}"
+    else:
+        socket_option = f"unix_sock={socket_dir}"
+    return "postgresql+{driver}://{user}:{password}@/{database}?{socket_option}".format(
+        driver=driver,
+        user=os.environ.get("CLOUD_SQL_USERNAME"),
+        password=os.environ.get("CLOUD_SQL_PASSWORD"),
+        database=os.environ.get("CLOUD_SQL_DATABASE_NAME"),
+        socket_option=socket_option)
+
+
 class ProductionConfig(Config):
-    SQLALCHEMY_DATABASE_URI = ("postgresql+pg8000://{user}:{password}@"
-                               "/{database}?unix_sock=/cloudsql/{instance}".format(
-                                   user=os.environ.get("CLOUD_SQL_USERNAME"),
-                                   password=os.environ.get("CLOUD_SQL_PASSWORD"),
-                                   instance=os.environ.get('CLOUD_SQL_INSTANCE_NAME'),
-                                   database=os.environ.get("CLOUD_SQL_DATABASE_NAME")))
+    DB_DRIVER = os.environ.get("CLOUD_SQL_DRIVER", "pg8000")
+    SQLALCHEMY_DATABASE_URI = cloud_sql_uri(DB_DRIVER)
+    SQLALCHEMY_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 2))
+    SQLALCHEMY_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 10))
+    SQLALCHEMY_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    SQLALCHEMY_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") == "1"
+    # App Engine runs several instances, so writes must reach the others' caches.
+    INVALIDATION_BACKEND = os.environ.get("INVALIDATION_BACKEND", "database")
     SSL_REDIRECT = True
 
     @classmethod
     def init_app(cls, app):
         Config.init_app(app)
-        import logging
         from logging.handlers import SMTPHandler
+        from app.reporting import init_logging
         credentials = None
         secure = None
         if getattr(cls, "MAIL_USERNAME", None) is not None:
@@ -62,11 +174,11 @@ class ProductionConfig(Config):
         mail_handler = SMTPHandler(mailhost=(cls.MAIL_SERVER, cls.MAIL_PORT),
                                    fromaddr=cls.MAIL_SENDER,
                                    toaddrs=[cls.ADMIN_ADDRESS],
-                                   subject=cls.MAIL_SUBJECT_PREFIX + "Application error",
+                                   subject=cls.MAIL_SUBJECT_PREFIX + "Application errors",
                                    credentials=credentials,
                                    secure=secure)
-        mail_handler.setLevel(logging.ERROR)
-        app.logger.addHandler(mail_handler)
+        # Sent from a listener thread as digests, never from the failing request.
+        init_logging(app, mail_handler)
 
 
 config = {
@@ -2,14 +2,11 @@ import os
 import sys
 
 import click
-import dotenv
-from flask_migrate import migrate, Migrate, upgrade
 
-dotenv.load_dotenv(dotenv.find_dotenv())
-
-import app.utils as utils
-from app import create_app, db
-from app.models import Comment, Demo, Image, Post, Role, User
+basedir = os.path.abspath(os.path.dirname(__file__))
+if os.path.exists(os.path.join(basedir, ".env")):
+    import dotenv
+    dotenv.load_dotenv(os.path.join(basedir, ".env"))
 
 COV = None
 if os.environ.get("FLASK_COVERAGE"):
@@ -17,13 +14,21 @@ if os.environ.get("FLASK_COVERAGE"):
     COV = coverage.coverage(branch=True, include="app/*")
     COV.start()
 
+from app import create_app, db
+
 config = os.getenv("FLASK_ENV") or "development"
 app = create_app(config)
-migrate_init = Migrate(app, db)
+
+# Flask-Migrate pulls in all of Alembic, so only set it up when the app is
+# being loaded by the flask command rather than by a web worker.
+if click.get_current_context(silent=True) is not None:
+    from flask_migrate import Migrate
+    migrate_init = Migrate(app, db)
 
 
 @app.shell_context_processor
 def make_shell_context():
+    from app.models import Comment, Demo, Image, Post, Role, User
     return {
         "db": db,
         "User": User,
@@ -49,7 +54,6 @@ def test(coverage):
         COV.save()
         print("Coverage summary:")
         COV.report()
-        basedir = os.path.abspath(os.path.dirname(__file__))
         covdir = os.path.join(basedir, "tmp", "coverage")
         COV.html_report(directory=covdir)
         print(f"HTML version: file://{covdir}/index.html")
@@ -66,16 +70,141 @@ def profile(length, profile_dir):
     app.run(debug=False)
 
 
+@app.cli.command()
+@click.argument("url")
+@click.option("--rows", default=10000, help="Number of rows in the benchmark table.")
+@click.option("--repeat", default=5, help="Number of times the table is read.")
+def bench_drivers(url, rows, repeat):
+    """Compare Postgres driver row decoding speed against the database at URL."""
+    from app.database import benchmark_drivers
+    for driver, rate in benchmark_drivers(url, rows=rows, repeat=repeat).items():
+        if rate is None:
+            print(f"{driver:>10}: not installed")
+        else:
+            print(f"{driver:>10}: {rate:,.0f} rows/s")
+
+
+@app.cli.command()
+@click.option("--log", "log_path", default=None,
+              help="Query log written with DB_QUERY_LOG. Defaults to the hot-path queries.")
+@click.option("--min-rows", default=1000, help="Ignore sequential scans of smaller tables.")
+def index_advice(log_path, min_rows):
+    """Flag queries that sequentially scan large tables."""
+    from app.indexes import advise, hot_path_fingerprints, load_fingerprints
+    log_path = log_path or app.config["DB_QUERY_LOG"]
+    if log_path and os.path.exists(log_path):
+        fingerprints = load_fingerprints(log_path)
+    else:
+        fingerprints = hot_path_fingerprints(db.engine)
+    advice = advise(db.engine, fingerprints, min_rows)
+    for statement, table, rows in advice:
+        print(f"Sequential scan of {table} ({rows} rows):\n    {statement}\n")
+    print(f"{len(fingerprints)} queries checked, {len(advice)} sequential scans found.")
+
+
+@app.cli.command()
+@click.option("--batch-size", default=1000, help="Number of comments updated per transaction.")
+def backfill_comment_paths(batch_size):
+    """Set the materialized path of every existing comment."""
+    from app.models import Comment
+    print(f"{Comment.backfill_paths(batch_size)} comments updated.")
+
+
+@app.cli.command()
+@click.option("--output", default=os.path.join(basedir, "frozen"), help="Directory to write to.")
+@click.option("--processes", default=os.cpu_count(), help="Number of rendering processes.")
+@click.option("--force", is_flag=True, help="Render every post, even unchanged ones.")
+def freeze(output, processes, force):
+    """Export the public pages as static files, re-rendering only changed posts."""
+    from app.freeze import freeze
+    rendered, removed = freeze(output, config, processes, force)
+    print(f"{len(rendered)} pages rendered, {len(removed)} removed, into {output}.")
+
+
+@app.cli.command()
+@click.option("--count", default=5, help="Number of related posts kept per post.")
+@click.option("--full", is_flag=True, help="Recompute every post, not only changed ones.")
+@click.option("--batch-size", default=256, help="Posts compared per similarity batch.")
+def related_posts(count, full, batch_size):
+    """Precompute the related posts shown on each post page; needs requirements/dev.txt."""
+    import time
+    from app.related import update_related_posts
+    start = time.perf_counter()
+    updated = update_related_posts(count, full, batch_size)
+    print(f"{updated} posts updated in {time.perf_counter() - start:.1f}s.")
+
+
+@app.cli.command()
+@click.option("--batch-size", default=1000, help="Rows read per batch.")
+def rebuild_rollups(batch_size):
+    """Recount the dashboard and archive rollups from the posts, comments and users."""
+    from app.rollups import rebuild_rollups
+    print(f"{rebuild_rollups(batch_size)} rollup rows written.")
+
+
+@app.cli.command()
+@click.argument("path")
+@click.option("--compare", help="An earlier dump to show the growth since.")
+@click.option("--top", default=20, help="Number of allocation sites shown.")
+@click.option("--key-type", default="lineno",
+              type=click.Choice(["lineno", "filename", "traceback"]),
+              help="How allocations are grouped.")
+def memory_report(path, compare, top, key_type):
+    """Show the top allocation sites in a dump written by /admin/memory?dump=1."""
+    from app.memprofile import format_report
+    for line in format_report(path, compare, top, key_type):
+        print(line)
+
+
+@app.cli.command()
+@click.argument("path")
+@click.option("--concurrency", default=8, help="Number of requests sent at once.")
+@click.option("--speed", default=1.0, help="Speed-up over the recorded pace; 0 sends at once.")
+@click.option("--limit", default=None, type=int, help="Only replay the first N requests.")
+def replay(path, concurrency, speed, limit):
+    """Replay requests recorded to TRAFFIC_RECORD_FILE against this app and database.
+
+    Recorded posts are replayed too, so use a copy of the data, not production.
+    """
+    from app.traffic import replay
+    app.config.update(WTF_CSRF_ENABLED=False, RATELIMIT_ENABLED=False)
+    report = replay(app, path, concurrency, speed, limit)
+    print(f"{'endpoint':32} {'requests':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>6} {'queries':>8}")
+    for endpoint, row in report.items():
+        print(f"{endpoint[:32]:32} {row['requests']:8} {row['p50'] * 1000:8.1f} "
+              f"{row['p95'] * 1000:8.1f} {row['p99'] * 1000:8.1f} {row['errors']:6} "
+              f"{row['queries']:8}" + (f"  ({row['skipped']} skipped)" if row["skipped"] else ""))
+
+
+@app.cli.command()
+@click.option("--iterations", default=1000, help="Calls timed per lookup.")
+def benchmark_queries(iterations):
+    """Compare hot lookups built as a Query each time with the baked query registry."""
+    from app.queries import benchmark
+    print(f"{'lookup':20} {'query µs':>10} {'baked µs':>10} {'saved':>7}")
+    for name, (query, baked) in benchmark(iterations).items():
+        print(f"{name:20} {query:10.1f} {baked:10.1f} {1 - baked / query:7.0%}")
+
+
 @app.cli.command()
 def deploy():
+    from flask_migrate import upgrade
+    from app.models import Role, Rollup
+    from app.rollups import rebuild_rollups
     upgrade()
     Role.insert_roles()
+    if Rollup.query.first() is None:
+        rebuild_rollups()
 
 
 @app.cli.command()
 def dev_setup():
     if config != "development":
         raise Exception("Don't run dev-setup if not using development config!")
+    from flask_migrate import migrate, upgrade
+    import app.utils as utils
+    from app.models import Role
     db.drop_all()
     migrate()
     upgrade()
@@ -84,3 +213,11 @@ def dev_setup():
     utils.insert_fake_users()
     utils.insert_fake_posts()
     utils.insert_fake_comments()
+
+
+@app.cli.command()
+@click.option("--length", default=25, help="Number of modules to include in the report.")
+def startup_report(length):
+    """Print a per-module import-time breakdown for a fresh web worker."""
+    from app.startup import import_times, startup_report, worker_import_code
+    print(startup_report(import_times(worker_import_code()), length))
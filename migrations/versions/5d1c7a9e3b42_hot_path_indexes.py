@@ -0,0 +1,44 @@
+"""hot path indexes
+
+Revision ID: 5d1c7a9e3b42
+Revises: 38e4672a3368
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1c7a9e3b42'
+down_revision = '38e4672a3368'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.create_index('ix_comment_post_id_parent_id_timestamp',
+                              ['post_id', 'parent_id', 'timestamp'], unique=False)
+        batch_op.create_index('ix_comment_parent_id_timestamp', ['parent_id', 'timestamp'],
+                              unique=False)
+        batch_op.create_index('ix_comment_author_id_timestamp', ['author_id', 'timestamp'],
+                              unique=False)
+        batch_op.create_index(batch_op.f('ix_comment_timestamp'), ['timestamp'], unique=False)
+        # Superseded by ix_comment_parent_id_timestamp.
+        batch_op.drop_index('ix_comment_parent_id')
+
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.create_index('ix_post_author_id_timestamp', ['author_id', 'timestamp'],
+                              unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_index('ix_post_author_id_timestamp')
+
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.create_index('ix_comment_parent_id', ['parent_id'], unique=False)
+        batch_op.drop_index(batch_op.f('ix_comment_timestamp'))
+        batch_op.drop_index('ix_comment_author_id_timestamp')
+        batch_op.drop_index('ix_comment_parent_id_timestamp')
+        batch_op.drop_index('ix_comment_post_id_parent_id_timestamp')
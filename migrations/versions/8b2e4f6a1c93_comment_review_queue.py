@@ -0,0 +1,31 @@
+"""comment review queue
+
+Revision ID: 8b2e4f6a1c93
+Revises: 5d1c7a9e3b42
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4f6a1c93'
+down_revision = '5d1c7a9e3b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        # Existing comments start out in the unreviewed queue.
+        batch_op.add_column(sa.Column('reviewed', sa.Boolean(), nullable=True,
+                                      server_default=sa.false()))
+        batch_op.create_index('ix_comment_reviewed_timestamp', ['reviewed', 'timestamp'],
+                              unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.drop_index('ix_comment_reviewed_timestamp')
+        batch_op.drop_column('reviewed')
@@ -0,0 +1,35 @@
+"""invalidation log
+
+Revision ID: a1d5f3b7c920
+Revises: f2a6c8e0b4d9
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1d5f3b7c920'
+down_revision = 'f2a6c8e0b4d9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('invalidation',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('kind', sa.String(length=16), nullable=True),
+                    sa.Column('object_id', sa.Integer(), nullable=True),
+                    sa.Column('published', sa.Float(), nullable=True),
+                    sa.PrimaryKeyConstraint('id'))
+    with op.batch_alter_table('invalidation', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_invalidation_published'), ['published'],
+                              unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('invalidation', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_invalidation_published'))
+
+    op.drop_table('invalidation')
@@ -0,0 +1,36 @@
+"""post views
+
+Revision ID: b6e2a4c8d013
+Revises: a1d5f3b7c920
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2a4c8d013'
+down_revision = 'a1d5f3b7c920'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('post_view',
+                    sa.Column('post_id', sa.Integer(), nullable=False),
+                    sa.Column('day', sa.Date(), nullable=False),
+                    sa.Column('views', sa.Integer(), nullable=True),
+                    sa.Column('sketch', sa.LargeBinary(), nullable=True),
+                    sa.Column('visitors', sa.Integer(), nullable=True),
+                    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('post_id', 'day'))
+    with op.batch_alter_table('post_view', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_post_view_day'), ['day'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('post_view', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_post_view_day'))
+
+    op.drop_table('post_view')
@@ -0,0 +1,36 @@
+"""related posts
+
+Revision ID: c3f7b1d9e5a2
+Revises: b6e2a4c8d013
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f7b1d9e5a2'
+down_revision = 'b6e2a4c8d013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('related_post',
+                    sa.Column('post_id', sa.Integer(), nullable=False),
+                    sa.Column('rank', sa.Integer(), autoincrement=False, nullable=False),
+                    sa.Column('related_id', sa.Integer(), nullable=True),
+                    sa.Column('score', sa.Float(), nullable=True),
+                    sa.ForeignKeyConstraint(['post_id'], ['post.id'], ondelete='CASCADE'),
+                    sa.ForeignKeyConstraint(['related_id'], ['post.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('post_id', 'rank'))
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('related_digest', sa.String(length=40), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('post', schema=None) as batch_op:
+        batch_op.drop_column('related_digest')
+
+    op.drop_table('related_post')
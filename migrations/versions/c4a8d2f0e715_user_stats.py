@@ -0,0 +1,44 @@
+"""user stats
+
+Revision ID: c4a8d2f0e715
+Revises: 8b2e4f6a1c93
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a8d2f0e715'
+down_revision = '8b2e4f6a1c93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('post_count', sa.Integer(), nullable=True,
+                                      server_default='0'))
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), nullable=True,
+                                      server_default='0'))
+        batch_op.add_column(sa.Column('last_activity', sa.DateTime(), nullable=True))
+
+    # Backfill from the existing posts and comments.
+    op.execute('UPDATE "user" SET '
+               'post_count = (SELECT count(*) FROM post WHERE post.author_id = "user".id), '
+               'comment_count = (SELECT count(*) FROM comment '
+               'WHERE comment.author_id = "user".id), '
+               'last_activity = (SELECT max(timestamp) FROM post '
+               'WHERE post.author_id = "user".id)')
+    op.execute('UPDATE "user" SET last_activity = '
+               '(SELECT max(timestamp) FROM comment WHERE comment.author_id = "user".id) '
+               'WHERE last_activity IS NULL OR last_activity < '
+               '(SELECT max(timestamp) FROM comment WHERE comment.author_id = "user".id)')
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('last_activity')
+        batch_op.drop_column('comment_count')
+        batch_op.drop_column('post_count')
@@ -0,0 +1,29 @@
+"""rollups
+
+Revision ID: d8a3e6f1b274
+Revises: c3f7b1d9e5a2
+Create Date: 2026-10-18 22:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a3e6f1b274'
+down_revision = 'c3f7b1d9e5a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rollup',
+                    sa.Column('period', sa.String(length=8), nullable=False),
+                    sa.Column('metric', sa.String(length=16), nullable=False),
+                    sa.Column('start', sa.Date(), nullable=False),
+                    sa.Column('count', sa.Integer(), nullable=True),
+                    sa.PrimaryKeyConstraint('period', 'metric', 'start'))
+
+
+def downgrade():
+    op.drop_table('rollup')
@@ -0,0 +1,32 @@
+"""comment paths
+
+Revision ID: e93b5c1d7f28
+Revises: c4a8d2f0e715
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e93b5c1d7f28'
+down_revision = 'c4a8d2f0e715'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing comments are filled in afterwards by flask backfill-comment-paths.
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('path', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('depth', sa.Integer(), nullable=True))
+        batch_op.create_index('ix_comment_path', ['path'], unique=False,
+                              postgresql_ops={'path': 'text_pattern_ops'})
+
+
+def downgrade():
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.drop_index('ix_comment_path')
+        batch_op.drop_column('depth')
+        batch_op.drop_column('path')
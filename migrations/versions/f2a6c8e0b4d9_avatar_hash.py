@@ -0,0 +1,41 @@
+"""avatar hash and profile version
+
+Revision ID: f2a6c8e0b4d9
+Revises: e93b5c1d7f28
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from hashlib import md5
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a6c8e0b4d9'
+down_revision = 'e93b5c1d7f28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('avatar_hash', sa.String(length=32), nullable=True))
+        batch_op.add_column(sa.Column('profile_version', sa.Integer(), nullable=True,
+                                      server_default='0'))
+
+    connection = op.get_bind()
+    users = sa.table('user', sa.column('id'), sa.column('email'), sa.column('avatar_hash'))
+    hashes = [{'user_id': id, 'new_hash': md5(email.lower().encode('utf-8')).hexdigest()}
+              for id, email in connection.execute(sa.select([users.c.id, users.c.email]))
+              if email]
+    if hashes:
+        connection.execute(users.update()
+                           .where(users.c.id == sa.bindparam('user_id'))
+                           .values(avatar_hash=sa.bindparam('new_hash')), hashes)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('profile_version')
+        batch_op.drop_column('avatar_hash')
@@ -0,0 +1,57 @@
+import unittest
+
+from app import create_app, db
+from app.models import Comment, Post, Role, User
+from app.threads import load_subtree
+
+
+class CommentPathTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(username="brian", email="brian@example.com", password="abc")
+        self.post = Post(title="title", slug="a-post", body="body", author=self.user)
+        db.session.add_all([self.user, self.post])
+        self.root = self.add_comment("root")
+        self.other = self.add_comment("other")
+        self.reply = self.add_comment("reply", self.root)
+        self.nested = self.add_comment("nested", self.reply)
+        self.second = self.add_comment("second", self.root)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_comment(self, body, parent=None):
+        c = Comment(body=body, post=self.post, author=self.user, parent=parent)
+        db.session.add(c)
+        db.session.commit()
+        return c
+
+    def test_path_on_insert(self):
+        self.assertEqual(self.root.path, Comment.path_segment(self.root.id))
+        self.assertEqual(self.root.depth, 0)
+        self.assertEqual(self.nested.path, self.reply.path + Comment.path_segment(self.nested.id))
+        self.assertEqual(self.nested.depth, 2)
+
+    def test_subtree(self):
+        self.assertEqual(self.root.subtree().all(), [self.reply, self.nested, self.second])
+        self.assertEqual(self.root.subtree(depth=1).all(), [self.reply, self.second])
+        self.assertEqual(self.other.subtree().all(), [])
+
+    def test_load_subtree(self):
+        node = load_subtree(self.root)
+        self.assertEqual([n.comment for n in node.replies], [self.reply, self.second])
+        self.assertEqual([n.comment for n in node.replies[0].replies], [self.nested])
+
+    def test_backfill(self):
+        expected = {c.id: (c.path, c.depth) for c in Comment.query}
+        Comment.query.update({"path": None, "depth": None})
+        db.session.commit()
+        self.assertEqual(Comment.backfill_paths(batch_size=2), 5)
+        db.session.expire_all()
+        self.assertEqual({c.id: (c.path, c.depth) for c in Comment.query}, expected)
@@ -0,0 +1,116 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import date, timedelta
+
+from app import create_app, db, page_cache, view_counter
+from app.counters import INTERNAL_REQUEST, HyperLogLog, ViewCounter, popular_posts
+from app.models import Post, PostView, Role, User
+
+
+class HyperLogLogTestCase(unittest.TestCase):
+    def test_estimate(self):
+        for n in (10, 1000, 50000):
+            sketch = HyperLogLog()
+            for i in range(n):
+                sketch.add(f"visitor-{i}")
+                sketch.add(f"visitor-{i}")
+            self.assertAlmostEqual(sketch.count(), n, delta=n * 0.1)
+
+    def test_merge(self):
+        a, b = HyperLogLog(), HyperLogLog()
+        for i in range(1000):
+            (a if i % 2 else b).add(str(i))
+        a.merge(HyperLogLog(b.to_bytes()))
+        self.assertAlmostEqual(a.count(), 1000, delta=100)
+
+
+class ViewCounterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app.config["VIEW_FLUSH_SECONDS"] = 3600
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        user = User(username="brian", email="brian@example.com", password="abc")
+        self.posts = [Post(title=f"title {i}", slug=f"post-{i}", body="body", author=user)
+                      for i in range(3)]
+        db.session.add_all([user] + self.posts)
+        db.session.commit()
+        view_counter.flush()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def view(self, slug, address):
+        self.client.get(f"/post/{slug}", base_url="https://localhost",
+                        environ_base={"REMOTE_ADDR": address})
+
+    def test_views_are_batched(self):
+        for i in range(5):
+            self.view("post-0", f"10.0.0.{i % 2}")
+        self.assertEqual(PostView.query.count(), 0)
+        self.assertEqual(view_counter.flush(), 1)
+        self.view("post-0", "10.0.0.2")
+        view_counter.flush()
+        row = PostView.query.one()
+        self.assertEqual((row.post_id, row.day, row.views, row.visitors),
+                         (self.posts[0].id, date.today(), 6, 3))
+
+    def test_internal_requests_are_not_views(self):
+        self.client.get("/post/post-0", base_url="https://localhost",
+                        environ_overrides={INTERNAL_REQUEST: True})
+        self.assertEqual(view_counter.flush(), 0)
+
+    def test_popular_posts(self):
+        today = date.today()
+        db.session.add_all([
+            PostView(post_id=self.posts[0].id, day=today - timedelta(days=9), visitors=50),
+            PostView(post_id=self.posts[1].id, day=today, visitors=20),
+            PostView(post_id=self.posts[2].id, day=today - timedelta(days=1), visitors=15),
+            PostView(post_id=self.posts[2].id, day=today - timedelta(days=30), visitors=1000),
+        ])
+        db.session.commit()
+        self.assertEqual(popular_posts(2), [self.posts[1], self.posts[2]])
+        page_cache.clear()
+        html = self.client.get("/", base_url="https://localhost").get_data(as_text=True)
+        self.assertIn("Popular posts", html)
+
+
+class BackgroundFlushTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = create_app("testing")
+        # The flush thread needs its own connection to the same database.
+        self.app.config.update(
+            SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(self.tmp.name, 'db.sqlite')}",
+            VIEW_FLUSH_SECONDS=0.05)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        user = User(username="brian", email="brian@example.com", password="abc")
+        self.post = Post(title="title", slug="post", body="body", author=user)
+        db.session.add_all([user, self.post])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.tmp.cleanup()
+
+    def test_flushed_off_the_request_path(self):
+        counter = ViewCounter()
+        with self.app.test_request_context("/post/post"):
+            counter.record(self.post.id)
+        deadline = time.monotonic() + 5
+        while not PostView.query.count() and time.monotonic() < deadline:
+            time.sleep(0.05)
+            db.session.remove()
+        self.assertEqual(PostView.query.one().views, 1)
@@ -0,0 +1,48 @@
+import sqlite3
+import unittest
+
+from sqlalchemy.engine.url import make_url
+
+from app import create_app, db
+from app.database import TimedQueuePool
+from app.metrics import metrics
+from config import cloud_sql_uri
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        metrics.reset()
+
+    def test_cloud_sql_uri(self):
+        self.assertTrue(cloud_sql_uri("pg8000").startswith("postgresql+pg8000://"))
+        self.assertIn("unix_sock=/cloudsql/", cloud_sql_uri("pg8000"))
+        self.assertTrue(cloud_sql_uri("psycopg2").startswith("postgresql+psycopg2://"))
+        self.assertIn("host=/cloudsql/", cloud_sql_uri("psycopg2"))
+
+    def test_pool_options(self):
+        self.app.config["SQLALCHEMY_POOL_PRE_PING"] = True
+        options = {"pool_size": 3}
+        db.apply_driver_hacks(self.app, make_url("postgresql+psycopg2://u:p@/db"), options)
+        self.assertTrue(options["pool_pre_ping"])
+        self.assertIs(options["poolclass"], TimedQueuePool)
+        self.assertTrue(options["use_batch_mode"])
+
+        options = {}
+        db.apply_driver_hacks(self.app, make_url("sqlite://"), options)
+        self.assertNotIn("pool_pre_ping", options)
+        self.assertIsNot(options["poolclass"], TimedQueuePool)
+
+    def test_pool_metrics(self):
+        pool = TimedQueuePool(lambda: sqlite3.connect(":memory:"), pool_size=2, max_overflow=1)
+        first = pool.connect()
+        second = pool.connect()
+        third = pool.connect()
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"]["db.pool.checkouts"], 3)
+        self.assertEqual(snapshot["gauges"]["db.pool.checked_out"], 3)
+        self.assertEqual(snapshot["gauges"]["db.pool.overflow"], 1)
+        self.assertEqual(snapshot["timings"]["db.pool.checkout_wait"]["count"], 3)
+        for connection in (first, second, third):
+            connection.close()
+        self.assertEqual(metrics.snapshot()["gauges"]["db.pool.checked_out"], 0)
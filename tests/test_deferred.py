@@ -0,0 +1,52 @@
+import unittest
+
+from app import create_app, db
+from app.models import Demo, Image, Post, Role, User
+
+
+class DeferredColumnsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        u = User(username="brian", email="brian@example.com", password="abc")
+        image = Image(filename="stars.png", data=b"\x89PNG" * 1000, alt_text="Stars")
+        db.session.add_all([
+            Post(title="title", slug="a-post", body="large-post-body", summary="summary", author=u),
+            Demo(title="Stars", slug="stars", summary="demo", body="large-demo-body",
+                 thumbnail=image)
+        ])
+        db.session.commit()
+        db.session.expire_all()
+        self.client = self.app.test_client()
+        self.statements = []
+        db.event.listen(db.engine, "before_cursor_execute", self.record_statement)
+
+    def tearDown(self):
+        db.event.remove(db.engine, "before_cursor_execute", self.record_statement)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def record_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def get(self, url):
+        response = self.client.get(url, base_url="https://localhost")
+        self.assertEqual(response.status_code, 200)
+        return response.get_data(True)
+
+    def test_list_views_skip_large_columns(self):
+        self.assertIn("summary", self.get("/blog"))
+        self.assertIn("Stars", self.get("/demos"))
+        sql = "\n".join(self.statements)
+        for column in ("post.body", "demo.body", "image.data"):
+            self.assertNotIn(column, sql)
+
+    def test_detail_views_load_large_columns(self):
+        self.assertIn("large-post-body", self.get("/post/a-post"))
+        self.assertEqual(len([s for s in self.statements if "post.body" in s]), 1)
+        response = self.client.get("/img/stars.png", base_url="https://localhost")
+        self.assertEqual(response.data, b"\x89PNG" * 1000)
@@ -0,0 +1,79 @@
+import unittest
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import create_app, db, fragment_cache
+from app.models import Comment, Post, Role, User
+
+
+class CommentFragmentTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.author = User(username="brian", email="brian@example.com", password="abc",
+                           active=True)
+        self.post = Post(title="title", slug="a-post", body="body", author=self.author)
+        self.comment = Comment(body="first version", post=self.post, author=self.author)
+        db.session.add_all([self.author, self.post, self.comment])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url):
+        response = self.client.get(url, base_url="https://localhost")
+        self.assertEqual(response.status_code, 200)
+        return response.get_data(True)
+
+    def login(self):
+        self.client.post("/auth/login", base_url="https://localhost",
+                         data={"username": "brian", "password": "abc"})
+
+    def test_controls_are_per_viewer(self):
+        html = self.get("/post/a-post")
+        self.assertEqual(len(fragment_cache), 1)
+        self.assertNotIn(f"/comment/edit/{self.comment.id}", html)
+        self.login()
+        html = self.get("/post/a-post")
+        self.assertIn(f"/comment/edit/{self.comment.id}", html)
+        self.assertEqual(len(fragment_cache), 1)
+
+    def test_edit_and_profile_change(self):
+        self.login()
+        self.assertIn("first version", self.get("/post/a-post"))
+        self.comment.body = "second version"
+        db.session.commit()
+        self.assertIn("second version", self.get(f"/comment/reply/{self.comment.id}"))
+        self.author.username = "brian2"
+        db.session.commit()
+        self.assertIn("/user/brian2", self.get(f"/comment/reply/{self.comment.id}"))
+        self.assertEqual(len(fragment_cache), 3)
+
+    def test_authors_loaded_with_comments(self):
+        for i in range(5):
+            user = User(username=f"user{i}", email=f"user{i}@example.com", password="abc")
+            reply = Comment(body=f"reply {i}", post=self.post, author=user, parent=self.comment)
+            db.session.add_all([user, reply, Comment(body=f"root {i}", post=self.post,
+                                                     author=user)])
+        db.session.commit()
+        self.login()
+        self.get("/post/a-post")
+        statements = []
+
+        def record(connection, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(Engine, "before_cursor_execute", record)
+        try:
+            html = self.get("/post/a-post")
+        finally:
+            event.remove(Engine, "before_cursor_execute", record)
+        self.assertIn("reply 4", html)
+        # Only the signed-in user is loaded on its own.
+        self.assertEqual(len([s for s in statements if "FROM user" in s]), 1)
@@ -0,0 +1,70 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from app import create_app, db
+from app.freeze import freeze, page_path
+from app.models import Comment, Post, Role, User
+from app.related import update_related_posts
+
+
+class FreezeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output = self.tmp.name
+        self.user = User(username="brian", email="brian@example.com", password="abc")
+        self.posts = [Post(title=f"title {i}", slug=f"post-{i}", body=f"body {i}",
+                           author=self.user) for i in range(3)]
+        db.session.add_all([self.user] + self.posts)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.tmp.cleanup()
+
+    def read(self, url):
+        with open(page_path(self.output, url), "rb") as f:
+            html = f.read()
+        with gzip.open(page_path(self.output, url) + ".gz") as f:
+            self.assertEqual(f.read(), html)
+        return html.decode()
+
+    def test_freeze(self):
+        rendered, removed = freeze(self.output, "testing")
+        self.assertEqual(rendered, ["/", "/blog", "/blog/archive", "/about-me", "/demos",
+                                    "/post/post-0", "/post/post-1", "/post/post-2"])
+        self.assertIn("body 1", self.read("/post/post-1"))
+        self.assertEqual(removed, [])
+
+    def test_incremental(self):
+        freeze(self.output, "testing")
+        db.session.add(Comment(body="new comment", post=self.posts[0], author=self.user))
+        self.posts[1].body = "new body"
+        db.session.delete(self.posts[2])
+        db.session.commit()
+        rendered, removed = freeze(self.output, "testing")
+        self.assertEqual(rendered, ["/", "/blog", "/blog/archive", "/about-me", "/demos",
+                                    "/post/post-0", "/post/post-1"])
+        self.assertEqual(removed, ["/post/post-2"])
+        self.assertIn("new comment", self.read("/post/post-0"))
+        self.assertFalse(os.path.exists(page_path(self.output, "/post/post-2")))
+        self.assertEqual(freeze(self.output, "testing")[0],
+                         ["/", "/blog", "/blog/archive", "/about-me", "/demos"])
+
+    def test_related_posts_change(self):
+        self.posts[0].body = "gardening tomatoes compost"
+        self.posts[1].body = "gardening tomatoes seedlings"
+        db.session.commit()
+        freeze(self.output, "testing")
+        update_related_posts(k=1)
+        rendered, _ = freeze(self.output, "testing")
+        self.assertIn("/post/post-0", rendered)
+        self.assertIn("/post/post-1", self.read("/post/post-0"))
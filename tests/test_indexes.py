@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+from app import create_app, db
+from app.indexes import (advise, hot_path_fingerprints, load_fingerprints, record_queries,
+                         sequential_scans)
+from app.models import Role
+
+
+class IndexAdviceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_sequential_scans(self):
+        self.assertEqual(sequential_scans("sqlite", ["SCAN comment"]), {"comment"})
+        self.assertEqual(sequential_scans("sqlite", ["SCAN comment USING INDEX ix"]), set())
+        self.assertEqual(
+            sequential_scans("postgresql", ["Sort", "  ->  Seq Scan on comment  (cost=0.00..)"]),
+            {"comment"})
+        self.assertEqual(sequential_scans("postgresql", ["Index Scan using ix on comment"]),
+                         set())
+
+    def test_hot_paths_use_indexes(self):
+        self.assertEqual(advise(db.engine, hot_path_fingerprints(db.engine), min_rows=0), [])
+
+    def test_flags_sequential_scans(self):
+        # The failing statement must not stop the ones after it being explained.
+        fingerprints = [("SELECT * FROM missing", []),
+                        ('SELECT * FROM "user" WHERE location = ?', ["Paris"])]
+        advice = advise(db.engine, fingerprints, min_rows=0)
+        self.assertEqual(advice, [(fingerprints[1][0], "user", 0)])
+        self.assertEqual(advise(db.engine, fingerprints, min_rows=1), [])
+
+    def test_record_queries(self):
+        class Query:
+            def __init__(self, statement, parameters):
+                self.statement = statement
+                self.parameters = parameters
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            queries = [Query("SELECT 1 WHERE ? = ?", (1, 2)), Query("SELECT 2", ())]
+            record_queries(queries, path)
+            record_queries(queries, path)
+            self.assertEqual(load_fingerprints(path), [("SELECT 1 WHERE ? = ?", [1, 2]),
+                                                       ("SELECT 2", [])])
+        finally:
+            os.remove(path)
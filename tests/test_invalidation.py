@@ -0,0 +1,121 @@
+import os
+import tempfile
+import time
+import unittest
+
+from app import create_app, db, page_cache
+from app.invalidation import RESET, DatabaseBackend, FileBackend, LocalBackend
+from app.metrics import metrics
+from app.models import Invalidation, Post, Role, User
+
+
+class InvalidationTestCase(unittest.TestCase):
+    backend = "file"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = create_app("testing")
+        self.app.config.update(INVALIDATION_BACKEND=self.backend,
+                               INVALIDATION_FILE=os.path.join(self.tmp.name, "log"),
+                               INVALIDATION_POLL_SECONDS=0)
+        self.app.extensions["invalidation"] = self.make_backend()
+        self.app.extensions["invalidation"].next_poll = 0
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(username="brian", email="brian@example.com", password="abc")
+        self.post = Post(title="title", slug="a-post", body="body", author=self.user)
+        db.session.add_all([self.user, self.post])
+        db.session.commit()
+        # Stands in for a second worker reading the same channel.
+        self.other = self.make_backend()
+        self.other.receive()
+        self.app.extensions["invalidation"].receive()
+        metrics.reset()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.tmp.cleanup()
+
+    def make_backend(self):
+        backend_class = {"file": FileBackend, "database": DatabaseBackend,
+                         "local": LocalBackend}[self.backend]
+        return backend_class(self.app)
+
+    def received(self):
+        return sorted((kind, id) for kind, id, published in self.other.receive())
+
+    def test_commit_publishes(self):
+        self.post.title = "new title"
+        db.session.commit()
+        self.assertEqual(self.received(), [("post", self.post.id)])
+        self.user.last_seen = None
+        db.session.commit()
+        self.assertEqual(self.received(), [])
+        self.user.username = "brian2"
+        db.session.commit()
+        self.assertEqual(self.received(), [("user", self.user.id)])
+        self.assertEqual(metrics.snapshot()["counters"]["invalidation.published"], 2)
+
+    def test_rollback_discards(self):
+        self.post.title = "new title"
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.received(), [])
+
+    def test_other_worker_evicts(self):
+        page_cache.set(("post", self.post.id), "cached")
+        page_cache.set(("post", 999), "cached")
+        self.other.publish([("post", self.post.id, 0)])
+        self.app.test_client().get("/about-me", base_url="https://localhost")
+        self.assertNotIn(("post", self.post.id), page_cache)
+        self.assertIn(("post", 999), page_cache)
+        self.other.publish([(RESET, None, 0)])
+        self.app.test_client().get("/about-me", base_url="https://localhost")
+        self.assertEqual(len(page_cache), 0)
+        self.assertEqual(metrics.snapshot()["timings"]["invalidation.lag"]["count"], 2)
+
+
+class DatabaseInvalidationTestCase(InvalidationTestCase):
+    backend = "database"
+
+    def test_late_commit_is_not_skipped(self):
+        self.post.title = "new title"
+        db.session.commit()
+        self.assertEqual(self.received(), [("post", self.post.id)])
+        # A row with a lower id that committed after the last poll read past it.
+        db.session.add(Invalidation(id=self.other.last_id - 100, kind="user",
+                                    object_id=self.user.id, published=time.time()))
+        db.session.commit()
+        self.assertEqual(self.received(), [("user", self.user.id)])
+        self.assertEqual(self.received(), [])
+
+
+class LocalInvalidationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_user_change_evicts_pages(self):
+        user = User(username="brian", email="brian@example.com", password="abc")
+        post = Post(title="title", slug="a-post", body="body", author=user)
+        db.session.add_all([user, post])
+        db.session.commit()
+        page_cache.set(("post", post.id), "cached")
+        page_cache.set(("post", 999), "cached")
+        user.username = "brian2"
+        db.session.commit()
+        self.app.test_client().get("/about-me", base_url="https://localhost")
+        self.assertNotIn(("post", post.id), page_cache)
+        self.assertIn(("post", 999), page_cache)
@@ -0,0 +1,69 @@
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from app import create_app, db
+from app.memprofile import MemoryProfiler, format_report
+from app.models import Role, User
+
+LEAK = []
+
+
+class MemoryProfilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app("testing")
+        self.app.config.update(MEMORY_PROFILE_ENABLED=True, MEMORY_PROFILE_SAMPLE_RATE=1,
+                               MEMORY_PROFILE_DIRECTORY=self.directory)
+        self.profiler = MemoryProfiler()
+        self.profiler.init_app(self.app)
+
+        @self.app.route("/leak")
+        def leak():
+            LEAK.append(bytearray(1 << 20))
+            return ""
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        LEAK.clear()
+        tracemalloc.stop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_endpoint_growth(self):
+        for _ in range(3):
+            self.client.get("/leak", base_url="https://localhost")
+        stats = self.profiler.endpoints["leak"]
+        self.assertEqual(stats["samples"], 3)
+        self.assertGreaterEqual(stats["delta"], 3 << 20)
+        self.assertIn("test_memprofile.py", stats["sites"].most_common(1)[0][0])
+        if hasattr(tracemalloc, "reset_peak"):
+            self.assertGreaterEqual(stats["max_peak"], 1 << 20)
+
+    def test_admin_endpoint_and_report(self):
+        admin = User(username="admin", email="admin@example.com", password="abc",
+                     role=Role.query.filter_by(name="admin").first(), active=True)
+        db.session.add(admin)
+        db.session.commit()
+        self.client.post("/auth/login", data={"username": "admin", "password": "abc"},
+                         base_url="https://localhost")
+        self.client.get("/leak", base_url="https://localhost")
+        response = self.client.get("/admin/memory?dump=1", base_url="https://localhost")
+        report = response.get_json()
+        self.assertIn("leak", report["endpoints"])
+        self.assertTrue(report["top"])
+        lines = list(format_report(report["dump"], top=5))
+        self.assertIn("allocation sites", lines[0])
+        self.assertEqual(len(lines), 6)
+
+    def test_not_enabled(self):
+        app = create_app("testing")
+        self.assertNotIn("memory_profiler", app.extensions)
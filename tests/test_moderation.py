@@ -0,0 +1,82 @@
+import unittest
+
+from app import create_app, db, page_cache
+from app.models import Comment, Post, Role, User
+
+
+class BulkModerationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client(use_cookies=True)
+        self.admin = self.add_user("brian", "admin")
+        self.spammer = self.add_user("spammer", "user")
+        self.post = Post(title="title", slug="a-post", body="body", author=self.admin)
+        db.session.add(self.post)
+        self.comments = [
+            Comment(body="hello", post=self.post, author=self.admin),
+            Comment(body="buy cheap pills", post=self.post, author=self.spammer),
+            Comment(body="more cheap pills", post=self.post, author=self.spammer),
+        ]
+        db.session.add_all(self.comments)
+        db.session.commit()
+        self.client.post("/auth/login",
+                         data={"username": "brian", "password": "abc"},
+                         base_url="https://localhost")
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @staticmethod
+    def add_user(username, role):
+        u = User(username=username,
+                 email=f"{username}@example.com",
+                 password="abc",
+                 role=Role.query.filter_by(name=role).first(),
+                 active=True)
+        db.session.add(u)
+        return u
+
+    def bulk(self, **data):
+        return self.client.post("/moderate/bulk",
+                                data=data,
+                                base_url="https://localhost",
+                                follow_redirects=True)
+
+    def disabled(self):
+        return [c.disabled for c in Comment.query.order_by(Comment.id)]
+
+    def test_selected(self):
+        page_cache.set(("post", self.post.id), "stale")
+        response = self.bulk(scope="selected", ids=[self.comments[1].id], disable="Disable")
+        self.assertIn("1 comments disabled.", response.get_data(True))
+        self.assertEqual(self.disabled(), [False, True, False])
+        self.assertNotIn(("post", self.post.id), page_cache)
+
+    def test_by_author(self):
+        self.bulk(scope="author", author="spammer", disable="Disable")
+        self.assertEqual(self.disabled(), [False, True, True])
+        self.bulk(scope="author", author="spammer", enable="Enable")
+        self.assertEqual(self.disabled(), [False, False, False])
+
+    def test_by_filter(self):
+        self.bulk(scope="filter", contains="cheap", disable="Disable")
+        self.assertEqual(self.disabled(), [False, True, True])
+        response = self.bulk(scope="filter", contains="", disable="Disable")
+        self.assertIn("Enter the text to match.", response.get_data(True))
+        # LIKE wildcards in the text are matched literally.
+        self.bulk(scope="filter", contains="%", enable="Enable")
+        self.assertEqual(self.disabled(), [False, True, True])
+        self.bulk(scope="filter", contains="m_re", enable="Enable")
+        self.assertEqual(self.disabled(), [False, True, True])
+
+    def test_unreviewed_queue(self):
+        self.bulk(scope="author", author="spammer", disable="Disable")
+        response = self.client.get("/moderate?unreviewed=1", base_url="https://localhost")
+        self.assertIn("hello", response.get_data(True))
+        self.assertNotIn("cheap pills", response.get_data(True))
@@ -0,0 +1,105 @@
+import fcntl
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from flask import Flask
+
+from app.cache import PageCache
+from app.metrics import metrics
+
+
+class PageCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.cache = PageCache(timeout=60)
+        self.calls = 0
+        self.release = threading.Event()
+
+    def render(self):
+        self.calls += 1
+        self.release.wait(5)
+        return f"page {self.calls}"
+
+    def run_concurrently(self, count):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.cache.get_or_compute("key", self.render))) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_misses_render_once(self):
+        self.assertEqual(self.run_concurrently(8), ["page 1"] * 8)
+        self.assertEqual(self.calls, 1)
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual((counters["page_cache.misses"], counters["page_cache.coalesced"]), (1, 7))
+
+    def test_stale_while_revalidate(self):
+        self.cache.stale_timeout = 60
+        self.cache.set("key", "old page")
+        self.cache._entries["key"] = (time.monotonic() - 1, "old page")
+        refresh = threading.Thread(target=self.cache.get_or_compute, args=("key", self.render))
+        refresh.start()
+        time.sleep(0.1)
+        self.assertEqual(self.cache.get_or_compute("key", self.render), "old page")
+        self.release.set()
+        refresh.join()
+        self.assertEqual(self.cache.get_or_compute("key", self.render), "page 1")
+        self.assertEqual(metrics.snapshot()["counters"]["page_cache.stale_hits"], 1)
+
+    def test_shared_directory(self):
+        self.release.set()
+        with tempfile.TemporaryDirectory() as directory:
+            self.cache.directory = directory
+            other = PageCache(timeout=60)
+            other.directory = directory
+            self.assertEqual(self.cache.get_or_compute("key", self.render), "page 1")
+            self.assertEqual(other.get_or_compute("key", self.render), "page 1")
+            self.assertEqual(self.calls, 1)
+            other.delete("key")
+            self.assertEqual(self.cache.get_or_compute("other", self.render), "page 2")
+            self.assertEqual(other.get_or_compute("key", self.render), "page 3")
+
+    def test_sweep(self):
+        self.release.set()
+        with tempfile.TemporaryDirectory() as directory:
+            self.cache.directory = directory
+            self.cache.get_or_compute("old", self.render)
+            self.cache.get_or_compute("new", self.render)
+            path = self.cache._path("old")
+            for name in (path, path + ".lock"):
+                os.utime(name, (0, 0))
+            self.cache.sweep()
+            name = os.path.basename(self.cache._path("new"))
+            self.assertEqual(sorted(os.listdir(directory)), [name, name + ".lock"])
+
+    def test_worker_start_keeps_shared_entries(self):
+        self.release.set()
+        with tempfile.TemporaryDirectory() as directory:
+            self.cache.directory = directory
+            self.cache.get_or_compute("key", self.render)
+            app = Flask(__name__)
+            app.config["PAGE_CACHE_DIRECTORY"] = directory
+            other = PageCache(timeout=60)
+            other.init_app(app)
+            self.assertEqual(other.get_or_compute("key", self.render), "page 1")
+
+    def test_shared_lock_timeout(self):
+        self.release.set()
+        with tempfile.TemporaryDirectory() as directory:
+            self.cache.directory = directory
+            self.cache.wait_timeout = 0.1
+            # Another worker hangs while rendering the same page.
+            with open(self.cache._path("key") + ".lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                start = time.monotonic()
+                self.assertEqual(self.cache.get_or_compute("key", self.render), "page 1")
+                self.assertLess(time.monotonic() - start, 2)
+            self.assertEqual(metrics.snapshot()["counters"]["page_cache.lock_timeouts"], 1)
@@ -0,0 +1,57 @@
+import unittest
+
+from app import create_app, db
+from app.models import Post, Role, User
+
+
+class ProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(username="brian", email="brian@example.com", password="abc", active=True)
+        db.session.add(self.user)
+        db.session.commit()
+        self.client = self.app.test_client(use_cookies=True)
+        self.client.post("/auth/login",
+                         data={"username": "brian", "password": "abc"},
+                         base_url="https://localhost")
+        self.statements = []
+        db.event.listen(db.engine, "before_cursor_execute", self.count_statement)
+
+    def tearDown(self):
+        db.event.remove(db.engine, "before_cursor_execute", self.count_statement)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def add_posts(self, count):
+        start = self.user.post_count
+        for i in range(start, start + count):
+            db.session.add(Post(title=f"post-{i}", slug=f"post-{i}", body="body", author=self.user))
+        db.session.commit()
+
+    def profile_queries(self, url="/user/brian"):
+        db.session.expire_all()
+        self.statements.clear()
+        response = self.client.get(url, base_url="https://localhost")
+        self.assertEqual(response.status_code, 200)
+        return len(self.statements), response.get_data(True)
+
+    def test_profile_is_paginated(self):
+        self.add_posts(25)
+        queries, html = self.profile_queries()
+        self.assertIn("25 posts, 0 comments.", html)
+        self.assertIn("post-24", html)
+        self.assertNotIn("post-14<", html)
+        _, html = self.profile_queries("/user/brian?page=3")
+        self.assertIn("post-0<", html)
+
+        # A much longer history costs the same number of queries.
+        self.add_posts(100)
+        self.assertEqual(self.profile_queries()[0], queries)
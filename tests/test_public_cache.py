@@ -0,0 +1,55 @@
+import unittest
+
+from app import create_app, db
+from app.models import Post, Role, User
+
+
+class PublicCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app.config["WTF_CSRF_ENABLED"] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        user = User(username="brian", email="brian@example.com", password="abc", active=True)
+        db.session.add_all([user, Post(title="title", slug="a-post", body="body", author=user)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url):
+        return self.client.get(url, base_url="https://localhost")
+
+    def assertPublic(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.cache_control.public)
+        self.assertIn("s-maxage=60", response.headers["Cache-Control"])
+        self.assertIn("Cookie", response.vary)
+        self.assertNotIn("Set-Cookie", response.headers)
+
+    def test_anonymous_pages_are_public(self):
+        self.assertPublic(self.get("/"))
+        self.assertPublic(self.get("/blog"))
+        self.assertPublic(self.get("/blog/archive"))
+        self.assertPublic(self.get("/blog/2019/3"))
+        self.assertPublic(self.get("/post/a-post"))
+        self.assertPublic(self.get("/post/a-post"))
+
+    def test_logged_in_pages_are_private(self):
+        self.app.config["WTF_CSRF_ENABLED"] = False
+        self.client.post("/auth/login", base_url="https://localhost",
+                         data={"username": "brian", "password": "abc"})
+        response = self.get("/post/a-post")
+        self.assertTrue(response.cache_control.private)
+        self.assertFalse(response.cache_control.public)
+        self.assertIn("Cookie", response.vary)
+
+    def test_session_writes_are_private(self):
+        response = self.get("/auth/login")
+        self.assertIn("Set-Cookie", response.headers)
+        self.assertTrue(response.cache_control.private)
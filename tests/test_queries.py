@@ -0,0 +1,87 @@
+import unittest
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.exceptions import NotFound
+
+from app import bus, create_app, db
+from app.models import Comment, Permission, Post, Role, User
+from app.queries import (benchmark, comment_by_id, or_404, post_by_slug, user_by_email,
+                         user_by_id, user_by_username)
+
+
+class QueriesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(username="brian", email="brian@example.com", password="abc")
+        self.post = Post(title="title", slug="post", body="body", author=self.user)
+        self.comment = Comment(body="hi", post=self.post, author=self.user)
+        db.session.add_all([self.user, self.post, self.comment])
+        db.session.commit()
+        self.ids = self.post.id, self.user.id, self.comment.id
+        self.statements = []
+        event.listen(Engine, "before_cursor_execute", self.count)
+
+    def tearDown(self):
+        event.remove(Engine, "before_cursor_execute", self.count)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count(self, connection, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def test_lookups(self):
+        post_id, user_id, comment_id = self.ids
+        db.session.expunge_all()
+        post = post_by_slug("post", body=True)
+        self.assertEqual(post.id, post_id)
+        self.assertNotIn("body", db.inspect(post).unloaded)
+        db.session.expunge_all()
+        self.assertIn("body", db.inspect(post_by_slug("post")).unloaded)
+        self.assertIsNone(post_by_slug("missing"))
+        self.assertEqual(user_by_username("brian").id, user_id)
+        self.assertEqual(user_by_email("brian@example.com").id, user_id)
+        self.assertEqual(user_by_id(user_id).id, user_id)
+        self.assertEqual(comment_by_id(comment_id).id, comment_id)
+        self.assertIsNone(comment_by_id(12345))
+        with self.assertRaises(NotFound):
+            or_404(None)
+
+    def test_role_memo(self):
+        default = Role.cached()
+        self.assertEqual(default.name, "user")
+        db.session.remove()
+        self.statements.clear()
+        user = User(username="alice", email="alice@example.com", password="abc")
+        self.assertEqual(user.role.name, "user")
+        self.assertIs(Role.cached("admin"), Role.cached("admin"))
+        self.assertEqual(len([s for s in self.statements if "FROM role" in s]), 1)
+        db.session.add(user)
+        db.session.commit()
+        self.assertEqual(User.query.filter_by(username="alice").one().role_id, default.id)
+        # A new member marks its role dirty, but no column changed.
+        self.assertIn("roles", self.app.extensions)
+
+    def test_role_changes_clear_memo(self):
+        self.assertFalse(Role.cached().has_permission(Permission.WRITE))
+        role = Role.query.filter_by(default=True).one()
+        role.add_permission(Permission.WRITE)
+        db.session.commit()
+        self.assertTrue(Role.cached().has_permission(Permission.WRITE))
+        Role.cached()
+        for handler in bus.handlers["role"]:
+            handler(role.id)
+        self.assertNotIn("roles", self.app.extensions)
+
+    def test_benchmark(self):
+        results = benchmark(5)
+        self.assertEqual(set(results), {"post by slug", "user by username", "user by id",
+                                        "comment by id", "default role"})
+        for query, baked in results.values():
+            self.assertGreater(query, 0)
+            self.assertGreater(baked, 0)
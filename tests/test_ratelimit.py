@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from app import create_app, db
+from app.models import Role, User
+from app.ratelimit import FileBackend, MemoryBackend, parse_limit
+
+
+class RateLimitTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app.config["RATELIMIT_LOGIN"] = "3/minute"
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_parse_limit(self):
+        self.assertEqual(parse_limit("10/minute"), (10, 60))
+        self.assertEqual(parse_limit("5/hours"), (5, 3600))
+
+    def test_memory_backend(self):
+        backend = MemoryBackend(self.app)
+        self.assertEqual([backend.hit("k", 2, 60) for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(backend.hit("k", 2, 60), 30, delta=1)
+        self.assertEqual(backend.hit("other", 2, 60), 0)
+
+    def test_prune_keeps_longer_periods(self):
+        backend = MemoryBackend(self.app, max_keys=1)
+        with mock.patch("app.ratelimit.time.monotonic") as monotonic:
+            monotonic.return_value = 1000
+            self.assertEqual(backend.hit("register", 1, 3600), 0)
+            monotonic.return_value = 1120
+            self.assertEqual(backend.hit("login", 10, 60), 0)
+            self.assertGreater(backend.hit("register", 1, 3600), 0)
+
+    def test_file_backend_is_shared(self):
+        directory = tempfile.mkdtemp()
+        self.app.config["RATELIMIT_DIRECTORY"] = directory
+        try:
+            first, second = FileBackend(self.app), FileBackend(self.app)
+            self.assertEqual(first.hit("k", 2, 60), 0)
+            self.assertEqual(second.hit("k", 2, 60), 0)
+            self.assertGreater(first.hit("k", 2, 60), 0)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_file_backend_prunes_full_buckets(self):
+        directory = tempfile.mkdtemp()
+        self.app.config["RATELIMIT_DIRECTORY"] = directory
+        try:
+            backend = FileBackend(self.app)
+            backend.hit("short", 2, 60)
+            backend.hit("long", 2, 3600)
+            with mock.patch("app.ratelimit.time.time", return_value=time.time() + 120):
+                backend.prune()
+            self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertEqual(backend.hit("long", 2, 3600), 0)
+            self.assertGreater(backend.hit("long", 2, 3600), 0)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_login_limited_before_hashing(self):
+        db.session.add(User(username="brian", email="brian@example.com", password="abc"))
+        db.session.commit()
+        data = {"username": "brian", "password": "xyz"}
+        with mock.patch.object(User, "verify_password", return_value=False) as verify:
+            for _ in range(3):
+                response = self.client.post("/auth/login", data=data, base_url="https://localhost")
+                self.assertEqual(response.status_code, 302)
+            response = self.client.post("/auth/login", data=data, base_url="https://localhost")
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers["Retry-After"], "20")
+            self.assertEqual(verify.call_count, 3)
+        # GETs are never limited.
+        response = self.client.get("/auth/login", base_url="https://localhost")
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_limited_per_username(self):
+        self.app.config["RATELIMIT_LOGIN_USERNAME"] = "4/hour"
+        with mock.patch.object(User, "verify_password", return_value=False):
+            for i in range(5):
+                response = self.client.post("/auth/login", base_url="https://localhost",
+                                            data={"username": "Brian", "password": "x"},
+                                            environ_base={"REMOTE_ADDR": f"10.0.0.{i}"})
+            self.assertEqual(response.status_code, 429)
+            response = self.client.post("/auth/login", base_url="https://localhost",
+                                        data={"username": "alice", "password": "x"},
+                                        environ_base={"REMOTE_ADDR": "10.0.0.9"})
+            self.assertEqual(response.status_code, 302)
+
+    def test_app_engine_header_only_trusted_on_app_engine(self):
+        self.app.config["RATELIMIT_LOGIN_USERNAME"] = None
+
+        def login(address):
+            return self.client.post("/auth/login", base_url="https://localhost",
+                                    data={"username": "brian", "password": "x"},
+                                    headers={"X-Appengine-User-Ip": address})
+        statuses = [login(f"10.0.0.{i}").status_code for i in range(4)]
+        self.assertEqual(statuses[-1], 429)
+        self.app.config["TRUST_APP_ENGINE_HEADERS"] = True
+        self.assertEqual(login("10.0.1.1").status_code, 302)
@@ -0,0 +1,84 @@
+import unittest
+
+from app import create_app, db
+from app.models import Post, RelatedPost, Role, User
+from app.related import tfidf, top_neighbours, update_related_posts
+
+TEXTS = {
+    "python-packaging": "Packaging python wheels with setuptools and pip for python projects",
+    "python-testing": "Testing python projects with pytest fixtures and pip installs",
+    "sourdough": "Baking sourdough bread with a starter, flour and water",
+    "baguettes": "Baking baguettes needs flour, water, salt and a hot oven for bread",
+    "hiking": "Hiking boots and trails in the mountains during autumn",
+}
+
+
+class TfidfTestCase(unittest.TestCase):
+    def test_neighbours(self):
+        matrix = tfidf(list(TEXTS.values()))
+        neighbours = dict(top_neighbours(matrix, list(range(len(TEXTS))), 1, batch_size=2))
+        self.assertEqual(neighbours[0][0][0], 1)
+        self.assertEqual(neighbours[2][0][0], 3)
+        self.assertEqual(neighbours[4], [])
+
+    def test_max_terms(self):
+        matrix = tfidf(["alpha beta gamma delta", "alpha beta gamma delta"], max_terms=2)
+        self.assertEqual(matrix.getnnz(axis=1).tolist(), [2, 2])
+
+
+class RelatedPostsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        user = User(username="brian", email="brian@example.com", password="abc")
+        self.posts = {slug: Post(title=slug, slug=slug, body=body, author=user)
+                      for slug, body in TEXTS.items()}
+        db.session.add_all([user] + list(self.posts.values()))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def related(self, slug):
+        return [s for s, title in self.posts[slug].related()]
+
+    def test_update(self):
+        self.assertEqual(update_related_posts(k=2), len(TEXTS))
+        self.assertEqual(self.related("python-packaging")[0], "python-testing")
+        self.assertEqual(self.related("sourdough")[0], "baguettes")
+        self.assertEqual(self.related("hiking"), [])
+        self.assertEqual(update_related_posts(k=2), 0)
+
+    def test_incremental_update(self):
+        update_related_posts(k=2)
+        self.posts["hiking"].body = "Hiking with pip, pytest and python wheels"
+        db.session.commit()
+        updated = update_related_posts(k=2)
+        self.assertLess(updated, len(TEXTS))
+        self.assertIn("hiking", self.related("python-testing"))
+        self.assertNotIn("hiking", self.related("sourdough"))
+
+    def test_deleted_posts(self):
+        update_related_posts(k=2)
+        db.session.delete(self.posts.pop("baguettes"))
+        db.session.commit()
+        update_related_posts(k=2)
+        self.assertNotIn("baguettes", self.related("sourdough"))
+        self.assertEqual(RelatedPost.query.filter_by(related_id=None).count(), 0)
+
+    def test_full_update(self):
+        update_related_posts(k=2)
+        self.assertEqual(update_related_posts(k=2, full=True), len(TEXTS))
+
+    def test_post_page(self):
+        update_related_posts(k=2)
+        response = self.client.get("/post/sourdough", base_url="https://localhost")
+        html = response.get_data(as_text=True)
+        self.assertIn("Related posts", html)
+        self.assertIn("/post/baguettes", html)
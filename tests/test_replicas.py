@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import create_app, db
+from app.models import Post, Role, User
+from config import config
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = config["testing"]
+        self.saved = (self.config.SQLALCHEMY_DATABASE_URI, self.config.DB_REPLICA_URIS)
+        self.config.SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(self.tmpdir, "primary.db")
+        self.config.DB_REPLICA_URIS = ["sqlite:///" + os.path.join(self.tmpdir, "replica.db")]
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.Model.metadata.create_all(db.get_engine(bind="replica0"))
+        Role.insert_roles()
+        self.user = User(username="brian", email="brian@example.com", password="abc", active=True)
+        db.session.add(self.user)
+        db.session.add(Post(title="Primary post", slug="primary", body="b", author=self.user))
+        db.session.commit()
+        # Stand in for a replica that has not caught up yet.
+        db.get_engine(bind="replica0").execute(
+            "INSERT INTO post (id, title, slug, body) VALUES (1, 'Replica post', 'primary', 'b')")
+        self.client = self.app.test_client(use_cookies=True)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.config.SQLALCHEMY_DATABASE_URI, self.config.DB_REPLICA_URIS = self.saved
+        shutil.rmtree(self.tmpdir)
+
+    def get(self, url):
+        return self.client.get(url, base_url="https://localhost").get_data(True)
+
+    def test_reads_go_to_replica(self):
+        self.assertIn("Replica post", self.get("/blog"))
+        self.assertIn("Replica post", self.get("/"))
+
+    def test_writes_stay_on_primary(self):
+        self.client.post("/auth/login",
+                         data={"username": "brian", "password": "abc"},
+                         base_url="https://localhost")
+        response = self.client.post("/post/primary",
+                                    data={"body": "a comment"},
+                                    base_url="https://localhost")
+        self.assertEqual(response.status_code, 302)
+        # The comment was written to the primary, so this client now reads from it.
+        self.assertIn("Primary post", self.get("/blog"))
+
+    def test_other_endpoints_use_primary(self):
+        self.client.post("/auth/login",
+                         data={"username": "brian", "password": "abc"},
+                         base_url="https://localhost")
+        self.assertIn("User brian", self.get("/user/brian"))
@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from app import create_app
+from app.reporting import DigestHandler, fingerprint, init_logging, stop_listener
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def error_record(divisor=0):
+    try:
+        1 / divisor
+    except ZeroDivisionError:
+        return logging.getLogger("test").makeRecord(
+            "test", logging.ERROR, __file__, 1, "Division failed", None, logging.sys.exc_info())
+
+
+def other_record():
+    try:
+        {}["missing"]
+    except KeyError:
+        return logging.getLogger("test").makeRecord(
+            "test", logging.ERROR, __file__, 1, "Lookup failed", None, logging.sys.exc_info())
+
+
+class DigestTestCase(unittest.TestCase):
+    def test_fingerprint(self):
+        self.assertEqual(fingerprint(error_record()), fingerprint(error_record()))
+        self.assertNotEqual(fingerprint(error_record()), fingerprint(other_record()))
+
+    def test_digest(self):
+        target = ListHandler()
+        handler = DigestHandler(target, interval=60)
+        for record in (error_record(), error_record(), other_record(), error_record()):
+            handler.handle(record)
+        self.assertEqual(len(target.records), 1)
+        self.assertTrue(target.records[0].getMessage().startswith("1 errors in 1 groups."))
+        handler.close()
+        self.assertEqual(len(target.records), 2)
+        digest = target.records[1].getMessage()
+        self.assertTrue(digest.startswith("3 errors in 2 groups."))
+        self.assertIn("2 x ERROR", digest)
+        self.assertIn("Lookup failed", digest)
+
+    def test_interval(self):
+        target = ListHandler()
+        handler = DigestHandler(target, interval=0.1)
+        handler.handle(error_record())
+        handler.handle(error_record())
+        time.sleep(0.3)
+        self.assertEqual(len(target.records), 2)
+        handler.close()
+
+
+class ReportingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app("testing")
+        self.app.config["PROPAGATE_EXCEPTIONS"] = False
+        self.app.config["LOG_DIRECTORY"] = self.directory
+        self.mail = ListHandler()
+        self.listener = init_logging(self.app, self.mail)
+
+        @self.app.route("/fail")
+        def fail():
+            return str(1 / 0)
+
+    def tearDown(self):
+        handler = self.app.logger.handlers[-1]
+        self.app.logger.removeHandler(handler)
+        logging.getLogger(f"{self.app.name}.access").removeHandler(handler)
+        shutil.rmtree(self.directory)
+
+    def read(self, filename):
+        with open(os.path.join(self.directory, filename)) as f:
+            return [json.loads(line) for line in f]
+
+    def test_errors_and_access(self):
+        client = self.app.test_client()
+        for _ in range(3):
+            response = client.get("/fail", base_url="https://localhost")
+            self.assertEqual(response.status_code, 500)
+        client.get("/about-me", base_url="https://localhost")
+        stop_listener(self.listener)
+
+        self.assertEqual(len(self.mail.records), 2)
+        self.assertIn("ZeroDivisionError", self.mail.records[0].getMessage())
+        self.assertIn("2 x ZeroDivisionError", self.mail.records[1].getMessage())
+        errors = self.read("error.log")
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(errors[0]["exc_type"], "ZeroDivisionError")
+        self.assertEqual(len({e["fingerprint"] for e in errors}), 1)
+        access = self.read("access.log")
+        self.assertEqual([(a["path"], a["status"]) for a in access],
+                         [("/fail", 500)] * 3 + [("/about-me", 200)])
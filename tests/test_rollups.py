@@ -0,0 +1,108 @@
+import unittest
+from datetime import date, datetime
+
+from app import create_app, db
+from app.models import Comment, Post, Role, Rollup, User
+from app.rollups import archive_months, month_starts, rebuild_rollups, series, totals
+
+
+class RollupsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(username="brian", email="brian@example.com", password="abc",
+                         member_since=datetime(2019, 3, 2))
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_post(self, slug, timestamp):
+        post = Post(title=slug, slug=slug, body="body", author=self.user, timestamp=timestamp)
+        db.session.add(post)
+        db.session.commit()
+        return post
+
+    def count(self, period, metric, start):
+        rollup = Rollup.query.get((period, metric, start))
+        return rollup.count if rollup else 0
+
+    def rows(self):
+        return sorted((r.period, r.metric, r.start, r.count) for r in Rollup.query)
+
+    def test_events(self):
+        self.add_post("a", datetime(2019, 3, 2, 10))
+        post = self.add_post("b", datetime(2019, 3, 5, 10))
+        comment = Comment(body="hi", post=post, author=self.user,
+                          timestamp=datetime(2019, 3, 5, 12))
+        db.session.add(comment)
+        db.session.commit()
+        self.assertEqual(self.count("day", "posts", date(2019, 3, 2)), 1)
+        self.assertEqual(self.count("month", "posts", date(2019, 3, 1)), 2)
+        self.assertEqual(self.count("month", "comments", date(2019, 3, 1)), 1)
+        self.assertEqual(self.count("day", "registrations", date(2019, 3, 2)), 1)
+
+        today = datetime.utcnow().date()
+        comment.disabled = True
+        self.user.active = True
+        db.session.commit()
+        Comment.moderate(Comment.query, disabled=False)
+        db.session.commit()
+        self.assertEqual(self.count("day", "moderations", today), 2)
+        self.assertEqual(self.count("day", "activations", today), 1)
+
+        db.session.delete(comment)
+        db.session.commit()
+        self.assertEqual(self.count("month", "comments", date(2019, 3, 1)), 0)
+
+    def test_rebuild(self):
+        self.add_post("a", datetime(2019, 3, 2, 10))
+        self.add_post("b", datetime(2019, 4, 5, 10))
+        expected = self.rows()
+        Rollup.query.filter_by(metric="posts").delete()
+        db.session.add(Rollup(period="day", metric="posts", start=date(2019, 1, 1), count=7))
+        db.session.commit()
+        self.assertEqual(rebuild_rollups(), 6)
+        self.assertEqual(self.rows(), expected)
+
+    def test_queries(self):
+        self.add_post("a", datetime(2019, 1, 20))
+        self.add_post("b", datetime(2019, 3, 2))
+        self.add_post("c", datetime(2019, 3, 9))
+        months = month_starts(date(2019, 3, 9), 3)
+        self.assertEqual(months, [date(2019, 1, 1), date(2019, 2, 1), date(2019, 3, 1)])
+        self.assertEqual(series("month", months, ["posts"]), {"posts": [1, 0, 2]})
+        self.assertEqual(totals()["posts"], 3)
+        self.assertEqual(archive_months(), [(date(2019, 3, 1), 2), (date(2019, 1, 1), 1)])
+
+    def test_archive(self):
+        self.add_post("march", datetime(2019, 3, 2))
+        self.add_post("april", datetime(2019, 4, 2))
+        response = self.client.get("/blog/archive", base_url="https://localhost")
+        self.assertIn("/blog/2019/3", response.get_data(as_text=True))
+        response = self.client.get("/blog/2019/3", base_url="https://localhost")
+        html = response.get_data(as_text=True)
+        self.assertIn("March 2019", html)
+        self.assertIn("/post/march", html)
+        self.assertNotIn("/post/april", html)
+        for url in ("/blog/2019/13", "/blog/2019/0", "/blog/0/1", "/blog/9999/12"):
+            response = self.client.get(url, base_url="https://localhost")
+            self.assertEqual(response.status_code, 404)
+
+    def test_dashboard(self):
+        admin = User(username="admin", email="admin@example.com", password="abc",
+                     role=Role.query.filter_by(name="admin").first(), active=True)
+        db.session.add(admin)
+        db.session.commit()
+        self.client.post("/auth/login", data={"username": "admin", "password": "abc"},
+                         base_url="https://localhost")
+        response = self.client.get("/admin", base_url="https://localhost")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Registrations", response.get_data(as_text=True))
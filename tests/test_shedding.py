@@ -0,0 +1,116 @@
+import threading
+import time
+import unittest
+
+from flask_login.utils import encode_cookie
+from sqlalchemy.engine import Engine
+
+from app import create_app, db
+from app.metrics import metrics
+from app.models import Role
+from app.shedding import HIGH, LOW, NORMAL, ConcurrencyLimit
+
+
+class ConcurrencyLimitTestCase(unittest.TestCase):
+    def test_priorities(self):
+        limit = ConcurrencyLimit(initial=4, low_share=0.5)
+        self.assertEqual([limit.acquire(LOW) for _ in range(3)], [0, 1, None])
+        self.assertEqual([limit.acquire(NORMAL) for _ in range(3)], [2, 3, None])
+        self.assertEqual(limit.acquire(HIGH), 4)
+
+    def test_aimd(self):
+        limit = ConcurrencyLimit(initial=10, minimum=2, target_latency=0.1, backoff=0.5)
+        limit.acquire(NORMAL)
+        limit.release(1.0, 5)
+        self.assertEqual(limit.limit, 5)
+        # Within the same window a second slow request is the same signal.
+        limit.acquire(NORMAL)
+        limit.release(1.0, 5)
+        self.assertEqual(limit.limit, 5)
+        limit.acquire(NORMAL)
+        limit.release(0.01, 4)
+        self.assertAlmostEqual(limit.limit, 5.2)
+        # Idle workers do not grow the limit.
+        limit.acquire(NORMAL)
+        limit.release(0.01, 0)
+        self.assertAlmostEqual(limit.limit, 5.2)
+        self.assertEqual(limit.inflight, 0)
+
+
+class LoadSheddingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.limit = self.app.extensions["load_shedder"]
+        metrics.reset()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url, results):
+        response = self.app.test_client().get(url, base_url="https://localhost")
+        response.get_data()
+        results.append(response)
+
+    def test_slow_database(self):
+        self.limit.limit = 4
+        self.limit.target_latency = 0.05
+
+        def slow_query(*args):
+            time.sleep(0.2)
+
+        db.event.listen(Engine, "before_cursor_execute", slow_query)
+        try:
+            results = []
+            threads = [threading.Thread(target=self.get, args=("/demos", results))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            db.event.remove(Engine, "before_cursor_execute", slow_query)
+        shed = [r for r in results if r.status_code == 503]
+        self.assertTrue(shed)
+        self.assertEqual(shed[0].headers["Retry-After"], "5")
+        self.assertLess(self.limit.limit, 4)
+        self.assertEqual(self.limit.inflight, 0)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"]["shedding.rejected.low"], len(shed))
+        self.assertIn("shedding.limit", snapshot["gauges"])
+
+    def test_signed_in_writes_are_protected(self):
+        for _ in range(20):
+            self.limit.acquire(NORMAL)
+        client = self.app.test_client()
+        response = client.get("/demos", base_url="https://localhost")
+        self.assertEqual(response.status_code, 503)
+        response = client.post("/auth/login", base_url="https://localhost")
+        self.assertEqual(response.status_code, 503)
+        client.set_cookie("localhost", "session", "x")
+        response = client.post("/auth/login", base_url="https://localhost")
+        self.assertEqual(response.status_code, 503)
+        with client.session_transaction() as session:
+            session["csrf_token"] = "token"
+        response = client.post("/auth/login", base_url="https://localhost")
+        self.assertEqual(response.status_code, 503)
+        with client.session_transaction() as session:
+            session["_user_id"] = "1"
+        response = client.post("/auth/login", base_url="https://localhost")
+        self.assertNotEqual(response.status_code, 503)
+
+    def test_remember_cookie_is_verified(self):
+        for _ in range(20):
+            self.limit.acquire(NORMAL)
+        client = self.app.test_client()
+        client.set_cookie("localhost", "remember_token", "1|forged")
+        response = client.post("/auth/login", base_url="https://localhost")
+        self.assertEqual(response.status_code, 503)
+        client.set_cookie("localhost", "remember_token", encode_cookie("1"))
+        response = client.post("/auth/login", base_url="https://localhost")
+        self.assertNotEqual(response.status_code, 503)
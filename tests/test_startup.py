@@ -0,0 +1,31 @@
+import os
+import unittest
+
+from flask import current_app
+
+from app import create_app
+from app.startup import import_times, loaded_lazy_modules, total_import_time, worker_import_code
+
+
+class StartupTestCase(unittest.TestCase):
+    times = None
+
+    @classmethod
+    def setUpClass(cls):
+        env = dict(os.environ, FLASK_ENV="testing")
+        env.pop("FLASK_COVERAGE", None)
+        cls.times = import_times(worker_import_code(), env=env)
+
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_lazy_modules_not_imported(self):
+        self.assertEqual(loaded_lazy_modules(self.times), [])
+
+    def test_import_time_budget(self):
+        self.assertLess(total_import_time(self.times), current_app.config["STARTUP_IMPORT_BUDGET"])
@@ -0,0 +1,89 @@
+import unittest
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import create_app, db
+from app.models import Comment, Post, Role, User
+from app.streaming import STREAM_ERROR
+
+
+class StreamingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app.config.update(STREAM_CHUNK_SIZE=256)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        user = User(username="brian", email="brian@example.com", password="abc", active=True)
+        post = Post(title="title", slug="a-post", body="the post body", author=user)
+        db.session.add_all([user, post])
+        db.session.add_all([Comment(body=f"comment-{i}", post=post, author=user)
+                            for i in range(5)])
+        db.session.commit()
+        self.client.post("/auth/login", base_url="https://localhost",
+                         data={"username": "brian", "password": "abc"})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_post(self):
+        response = self.client.get("/post/a-post", base_url="https://localhost")
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_streamed_post(self):
+        chunks = list(self.get_post().response)
+        self.assertGreater(len(chunks), 1)
+        html = b"".join(chunks).decode()
+        self.assertLess(html.index("the post body"), html.index("comment-0"))
+        for i in range(5):
+            self.assertIn(f"comment-{i}", html)
+
+    def test_comments_load_after_first_chunk(self):
+        statements = []
+
+        def record(connection, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(Engine, "before_cursor_execute", record)
+        try:
+            chunks = iter(self.get_post().response)
+            self.assertIn(b"<html", next(chunks))
+            self.assertFalse([s for s in statements if "FROM comment" in s])
+            list(chunks)
+            self.assertTrue([s for s in statements if "FROM comment" in s])
+        finally:
+            event.remove(Engine, "before_cursor_execute", record)
+
+    def test_flashes_shown_once(self):
+        response = self.client.post("/post/a-post", data={"body": "new comment"},
+                                    base_url="https://localhost")
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("Comment added.", self.get_post().get_data(as_text=True))
+        self.assertNotIn("Comment added.", self.get_post().get_data(as_text=True))
+
+    def test_queries_logged_after_streaming(self):
+        self.app.config["DB_SLOW_QUERY_TIME"] = 0
+        with self.assertLogs(self.app.logger, "WARNING") as logs:
+            self.get_post().get_data()
+        self.assertTrue([line for line in logs.output if "FROM comment" in line])
+
+    def test_error_while_streaming(self):
+        def broken(comment, moderate=False):
+            raise RuntimeError("broken")
+        self.app.jinja_env.globals["comment_fragment"] = broken
+        html = self.get_post().get_data(as_text=True)
+        self.assertIn("the post body", html)
+        self.assertIn(STREAM_ERROR, html)
+        self.assertNotIn("comment-0", html)
+
+    def test_buffered_when_disabled(self):
+        self.app.config["STREAM_TEMPLATES"] = False
+        response = self.client.get("/post/a-post", base_url="https://localhost")
+        chunks = list(response.response)
+        self.assertEqual(len(chunks), 1)
+        self.assertIn(b"comment-4", chunks[0])
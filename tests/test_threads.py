@@ -0,0 +1,85 @@
+import unittest
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from app.models import Comment, Post, Role, User
+
+
+class CommentThreadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app.config.update(COMMENT_ROOTS_PER_PAGE=2,
+                               COMMENT_REPLIES_PER_PAGE=2,
+                               COMMENT_THREAD_DEPTH=1)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(username="brian", email="brian@example.com", password="abc")
+        self.post = Post(title="title", slug="a-post", body="body", author=self.user)
+        db.session.add_all([self.user, self.post])
+        self.time = datetime(2020, 1, 1)
+        self.roots = [self.add_comment(f"root-{i}") for i in range(3)]
+        self.replies = [self.add_comment(f"reply-{i}", self.roots[2]) for i in range(3)]
+        self.nested = self.add_comment("nested-reply", self.replies[0])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_comment(self, body, parent=None):
+        self.time += timedelta(minutes=1)
+        c = Comment(body=body, post=self.post, author=self.user, parent=parent, timestamp=self.time)
+        db.session.add(c)
+        return c
+
+    def get(self, url):
+        response = self.client.get(url, base_url="https://localhost")
+        self.assertEqual(response.status_code, 200)
+        return response.get_data(True)
+
+    def test_post_page(self):
+        html = self.get("/post/a-post")
+        for body in ["root-2", "root-1", "reply-0", "reply-1"]:
+            self.assertIn(body, html)
+        for body in ["root-0", "reply-2", "nested-reply"]:
+            self.assertNotIn(body, html)
+        self.assertIn("More comments", html)
+        self.assertIn(f"/comment/{self.replies[0].id}/replies", html)
+
+    def test_more_roots(self):
+        html = self.get(f"/post/a-post/comments?after={self.roots[1].timestamp.isoformat()}_"
+                        f"{self.roots[1].id}")
+        self.assertIn("root-0", html)
+        self.assertNotIn("root-1", html)
+        self.assertNotIn("More comments", html)
+
+    def test_more_replies(self):
+        c = self.replies[1]
+        html = self.get(f"/comment/{self.roots[2].id}/replies?after="
+                        f"{c.timestamp.isoformat()}_{c.id}")
+        self.assertIn("reply-2", html)
+        self.assertNotIn("reply-1", html)
+        self.assertIn("nested-reply", self.get(f"/comment/{self.replies[0].id}/replies"))
+
+    def test_queries_do_not_grow_with_thread(self):
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        db.event.listen(db.engine, "before_cursor_execute", count)
+        try:
+            self.get("/post/a-post")
+            before = len(statements)
+            for i in range(20):
+                self.add_comment(f"late-reply-{i}", self.roots[1])
+            db.session.commit()
+            statements.clear()
+            self.get("/post/a-post")
+            self.assertEqual(len(statements), before)
+        finally:
+            db.event.remove(db.engine, "before_cursor_execute", count)
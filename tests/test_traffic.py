@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import create_app, db, view_counter
+from app.models import Comment, Post, Role, User
+from app.shedding import NORMAL
+from app.traffic import TrafficRecorder, replay
+
+
+class TrafficTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "traffic.jsonl")
+        self.app = create_app("testing")
+        # Replay sends requests from several threads, so each needs its own connection.
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = \
+            f"sqlite:///{os.path.join(self.directory, 'db.sqlite')}"
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(username="brian", email="brian@example.com", password="abc",
+                         active=True)
+        self.post = Post(title="title", slug="post", body="body", author=self.user)
+        db.session.add_all([self.user, self.post])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def read(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_record(self):
+        self.app.config.update(TRAFFIC_RECORD_FILE=self.path, TRAFFIC_SAMPLE_RATE=1)
+        TrafficRecorder().init_app(self.app)
+        client = self.app.test_client()
+        client.get("/about-me?x=1", base_url="https://localhost").get_data()
+        client.post("/auth/login", data={"username": "brian", "password": "abc"},
+                    base_url="https://localhost")
+        client.post("/post/post", data={"body": "secret words"},
+                    base_url="https://localhost").get_data()
+        entries = self.read()
+        self.assertEqual([(e["m"], e["p"], e["e"], e["s"], e["c"]) for e in entries], [
+            ("GET", "/about-me?x=1", "main.about_me", "anonymous", 200),
+            ("POST", "/post/post", "main.post", "user", 302)
+        ])
+        self.assertEqual(entries[1]["f"], ["body"])
+        with open(self.path) as f:
+            self.assertNotIn("secret", f.read())
+        self.assertEqual(Comment.query.one().body, "secret words")
+
+    def test_replay(self):
+        entries = [{"t": 100 + i / 100, "m": "GET", "p": "/post/post", "e": "main.post",
+                    "s": "anonymous"} for i in range(6)]
+        entries += [
+            {"t": 100.1, "m": "POST", "p": "/post/post", "e": "main.post", "s": "user",
+             "f": ["body", "submit"]},
+            {"t": 100.2, "m": "GET", "p": "/about-me", "e": "main.about_me", "s": "moderator"}
+        ]
+        with open(self.path, "w") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+        self.app.config.update(WTF_CSRF_ENABLED=False, RATELIMIT_ENABLED=False,
+                               TRAFFIC_RECORD_FILE=self.path + ".again", TRAFFIC_SAMPLE_RATE=1)
+        TrafficRecorder().init_app(self.app)
+        # A full worker would shed every request that is not marked internal.
+        for _ in range(20):
+            self.app.extensions["load_shedder"].acquire(NORMAL)
+        view_counter.flush()
+        report = replay(self.app, self.path, concurrency=4, speed=10)
+        self.assertFalse(os.path.exists(self.path + ".again"))
+        self.assertEqual(view_counter.flush(), 0)
+        self.assertEqual(report["main.post"]["requests"], 7)
+        self.assertEqual(report["main.post"]["errors"], 0)
+        self.assertGreater(report["main.post"]["queries"], 7)
+        self.assertGreater(report["main.post"]["p99"], 0)
+        self.assertEqual(report["main.about_me"]["skipped"], 1)
+        self.assertEqual(Comment.query.one().body, "replayed")
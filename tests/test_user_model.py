@@ -1,9 +1,10 @@
 import unittest
+from datetime import datetime
 
 from flask import current_app
 
 from app import create_app, db
-from app.models import AnonymousUser, Permission, Role, User
+from app.models import AnonymousUser, Comment, Permission, Post, Role, User
 
 
 class UserModelTestCase(unittest.TestCase):
@@ -47,3 +48,33 @@ class UserModelTestCase(unittest.TestCase):
         u = AnonymousUser()
         for perm in ["FOLLOW", "COMMENT", "WRITE", "MODERATE", "ADMIN"]:
             self.assertFalse(u.can(getattr(Permission, perm)))
+
+    def test_author_stats(self):
+        u = User(email="example@example.com", username="example", password="user")
+        db.session.add(u)
+        db.session.commit()
+        self.assertEqual((u.post_count, u.comment_count, u.last_activity), (0, 0, None))
+
+        p = Post(title="title", body="body", author=u, timestamp=datetime(2020, 1, 2))
+        db.session.add(p)
+        db.session.add(Comment(body="comment", post=p, author=u, timestamp=datetime(2020, 1, 3)))
+        db.session.add(Comment(body="old", post=p, author=u, timestamp=datetime(2019, 1, 1)))
+        db.session.commit()
+        self.assertEqual((u.post_count, u.comment_count, u.last_activity),
+                         (1, 2, datetime(2020, 1, 3)))
+
+        db.session.delete(p.comments.first())
+        db.session.commit()
+        self.assertEqual(u.comment_count, 1)
+
+    def test_avatar_hash(self):
+        u = User(email="Example@example.com", username="example", password="user")
+        db.session.add(u)
+        db.session.commit()
+        self.assertEqual(u.avatar_hash, "23463b99b62a72f26ed677cc556c44e8")
+        self.assertIn(u.avatar_hash, u.avatar(40))
+        version = u.profile_version
+        u.email = "other@example.com"
+        db.session.commit()
+        self.assertEqual(u.avatar_hash, User.email_hash("other@example.com"))
+        self.assertGreater(u.profile_version, version)
@@ -0,0 +1,80 @@
+import unittest
+
+from flask import template_rendered
+
+from app import create_app, db, page_cache
+from app.models import Comment, Post, Role, User
+from app.warmup import HOT_TEMPLATES
+
+
+class WarmupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app.config["TRUST_APP_ENGINE_HEADERS"] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.user = User(username="brian", email="brian@example.com", password="abc", active=True)
+        self.post = Post(title="title", slug="a-post", body="post-body", author=self.user)
+        db.session.add_all([self.user, self.post])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, url):
+        return self.client.get(url, base_url="https://localhost",
+                               headers={"X-Appengine-User-Ip": "0.1.0.3"})
+
+    def test_only_app_engine(self):
+        response = self.client.get("/_ah/warmup", base_url="https://localhost")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get("/_ah/warmup", base_url="https://localhost",
+                                   headers={"X-Appengine-User-Ip": "203.0.113.5"})
+        self.assertEqual(response.status_code, 404)
+        self.app.config["TRUST_APP_ENGINE_HEADERS"] = False
+        self.assertEqual(self.get("/_ah/warmup").status_code, 404)
+        self.assertNotIn(("post", self.post.id), page_cache)
+
+    def test_warmup(self):
+        response = self.get("/_ah/warmup")
+        self.assertEqual(response.status_code, 200)
+        report = response.get_json()
+        self.assertEqual(sorted(report), ["connections", "posts", "roles", "templates"])
+        self.assertEqual(report["roles"]["count"], 3)
+        self.assertEqual(report["posts"]["count"], 1)
+        self.assertIn(("post", self.post.id), page_cache)
+
+        # Repeating the warmup does not re-render cached posts.
+        response = self.get("/_ah/warmup")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["posts"]["count"], 0)
+
+    def test_post_page_cache(self):
+        self.get("/_ah/warmup")
+        response = self.get("/post/a-post")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("post-body", response.get_data(True))
+
+        c = Comment(body="new-comment", post=self.post, author=self.user)
+        db.session.add(c)
+        db.session.commit()
+        self.assertNotIn(("post", self.post.id), page_cache)
+        self.assertIn("new-comment", self.get("/post/a-post").get_data(True))
+
+    def test_hot_templates_cover_post_page(self):
+        db.session.add(Comment(body="a comment", post=self.post, author=self.user))
+        db.session.commit()
+        rendered = []
+
+        def record(sender, template, context, **extra):
+            rendered.append(template.name)
+        with template_rendered.connected_to(record, self.app):
+            self.get("/")
+            self.get("/post/a-post")
+        self.assertIn("_comment.html.j2", rendered)
+        self.assertEqual(set(rendered) - set(HOT_TEMPLATES), set())